@@ -1,11 +1,45 @@
+import contextvars
+import os
 import streamlit as st
-import requests
 import pandas as pd
-import plotly.express as px
-import altair as alt
 import plotly.graph_objects as go
-from datetime import datetime, timedelta
-import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+from aggregations import METRICS_SCHEMA, metrics_from_rows
+from charts import (
+    SCATTER_POINT_BUDGET,
+    asset_volume_chart,
+    chain_volume_chart,
+    cohort_retention_chart,
+    create_trades_scatter,
+    cumulative_trades_chart,
+    cumulative_users_chart,
+    cumulative_volume_chart,
+    extend_trades_scatter,
+    new_vs_returning_chart,
+    range_volume_chart,
+)
+from figure_cache import FigureCache
+from instrumentation import recorder, span
+from live_tail import LiveTail
+from metrics_engine import HourlyMetricsEngine
+from pyramid import AggregatePyramid
+from queries import (
+    CHART_RANGES,
+    CHART_WINDOW,
+    LOOKBACK_HOURS,
+    history_start,
+    metrics_query,
+)
+from query_cache import QueryCache
+from refresher import BackgroundRefresher, make_dashboard_refresh
+from sketches import HourlyWalletSketches
+from supabase_client import SupabaseClient
+from timeline import continuation
+from trade_store import TradeStore
+from wallet_index import WalletIndex
 
 # Retrieve secrets from the secrets.toml file via st.secrets
 supabase_url = st.secrets["supabase"]["url"]
@@ -17,88 +51,83 @@ st.set_page_config(
     layout="wide"
 )
 
-st.cache_data.clear()
-st.cache_resource.clear()
+# Every rerun is traced; spans are listed in the "Debug timings" sidebar panel
+# and, when instrumentation.jsonl_path is set in secrets, appended there
+recorder.jsonl_path = st.secrets.get("instrumentation", {}).get("jsonl_path")
+trace = recorder.start_trace()
 
 
-@st.cache_data
-def execute_sql(query):
-    headers = {
-        "apikey": supabase_key,
-        "Authorization": f"Bearer {supabase_key}",
-        "Content-Type": "application/json"
-    }
-    
-    rpc_endpoint = f"{supabase_url}/rest/v1/rpc/execute_sql"
-    payload = {"query": query}
-    response = requests.post(rpc_endpoint, headers=headers, json=payload)
-    data=response.json()
-
-    # Extract the 'result' from each item in the list
-    cleaned_data = [item['result'] for item in data]
-    df = pd.DataFrame(cleaned_data)
-    return df
-
-
-query = """
-SELECT 
-    source_chain as chain,
-    source_id as asset,
-    source_volume as volume,
-    block_timestamp,
-    transaction_hash,
-    sender_address as wallet
-FROM public.main_volume_table
-UNION ALL
-SELECT 
-    dest_chain as chain,
-    dest_id as asset,
-    dest_volume as volume,
-    block_timestamp,
-    transaction_hash,
-    sender_address as wallet
-FROM public.main_volume_table
-Order by block_timestamp desc, transaction_hash
-"""
-
-df = execute_sql(query)
+def show_chart(fig, chart_id, **kwargs):
+    """st.plotly_chart, timed as a render span."""
+    with span("render", chart_id):
+        st.plotly_chart(fig, **kwargs)
+
+
+# One pooled, keep-alive client per server process. Trade legs are pulled as
+# CSV parsed by pyarrow; set supabase.wire_format = "json" to use plain rows.
+@st.cache_resource
+def get_supabase_client():
+    wire_format = st.secrets["supabase"].get("wire_format", "csv")
+    return SupabaseClient(supabase_url, supabase_key, wire_format=wire_format)
+
+
+supabase = get_supabase_client()
+
+
+# Trade legs live in a local Parquet store; each refresh only fetches rows past
+# the stored watermark (plus a short re-fetch window for late corrections).
+# Legs older than any panel can show are neither fetched nor kept.
+TRADE_STORE_DIR = ".trade_store"
+
+
+@st.cache_resource
+def get_trade_store():
+    return TradeStore(TRADE_STORE_DIR, history=history_start)
+
+
+# The data version is only re-probed every few seconds, so a refresh with no
+# new trades costs nothing
+@st.cache_resource
+def get_query_cache():
+    return QueryCache(probe_interval=30, default_ttl=300)
 
-## METRICS
-query_metrics="""
-with pre as (
-SELECT 
-    source_chain as chain,
-    source_id as asset,
-    source_volume as volume,
-    block_timestamp,
-    transaction_hash,
-    sender_address as wallet
-FROM public.main_volume_table
-UNION ALL
-SELECT 
-    dest_chain as chain,
-    dest_id as asset,
-    dest_volume as volume,
-    block_timestamp,
-    transaction_hash,
-    sender_address as wallet
-FROM public.main_volume_table
-Order by block_timestamp desc, transaction_hash
-)
-SELECT 
-    sum(case when block_timestamp > NOW()- INTERVAL '24 hours' THEN volume ELSE 0 END) as volume_day,
-    sum(case when block_timestamp > NOW()- INTERVAL '7 days' THEN volume ELSE 0 END) as volume_week,
-    sum(case when block_timestamp >= DATE_TRUNC('month', NOW()) THEN volume ELSE 0 END) as volume_mtd,
-    COUNT(DISTINCT CASE WHEN block_timestamp > NOW() - INTERVAL '24 hours' THEN wallet END) AS users_day,
-    COUNT(DISTINCT CASE WHEN block_timestamp > NOW() - INTERVAL '7 days' THEN wallet END) AS users_week,
-    COUNT(DISTINCT CASE WHEN block_timestamp >= DATE_TRUNC('month', NOW()) THEN wallet END) AS users_mtd,
-    COUNT(CASE WHEN block_timestamp > NOW() - INTERVAL '24 hours' THEN transaction_hash END) AS trades_day,
-    COUNT(CASE WHEN block_timestamp > NOW() - INTERVAL '7 days' THEN transaction_hash END) AS trades_week,
-    COUNT(CASE WHEN block_timestamp >= DATE_TRUNC('month', NOW()) THEN transaction_hash END) AS trades_mtd
-FROM pre
-"""
-metrics = execute_sql(query_metrics)
 
+# Per-hour HyperLogLog wallet sketches, rebuilt only for re-fetched hours
+@st.cache_resource
+def get_wallet_sketches():
+    return HourlyWalletSketches(os.path.join(TRADE_STORE_DIR, "wallet_sketches.npz"))
+
+
+# One background worker per server process refreshes the trade store and the
+# aggregates every REFRESH_INTERVAL seconds; reruns only read its newest
+# snapshot and never wait on Supabase (except for the very first load)
+REFRESH_INTERVAL = st.secrets.get("refresh", {}).get("interval_s", 60)
+
+
+@st.cache_resource
+def get_refresher():
+    sketches = get_wallet_sketches()
+    refresh = make_dashboard_refresh(
+        supabase,
+        get_query_cache(),
+        get_trade_store(),
+        sketches,
+        HourlyMetricsEngine(sketches),
+        # Minute to week volume tiles, kept beyond the legs' history
+        AggregatePyramid(os.path.join(TRADE_STORE_DIR, "pyramid")),
+        # First-seen and lifetime totals per wallet
+        WalletIndex(os.path.join(TRADE_STORE_DIR, "wallet_index")),
+    )
+    return BackgroundRefresher(refresh, interval=REFRESH_INTERVAL).start()
+
+
+refresher = get_refresher()
+ticket = 0
+if st.sidebar.button("Refresh now"):
+    get_query_cache().invalidate()
+    ticket = refresher.request_refresh(force=True)
+
+## METRICS
 st.markdown("""
     <style>
     [data-testid="stMetricValue"] {
@@ -125,392 +154,275 @@ st.markdown("""
 """, unsafe_allow_html=True)
 current_month = datetime.now().strftime("%B")
 
-# First row - Volume metrics
-c1, c2, c3 = st.columns(3)
-c1.metric("24h Volume", f"{metrics['volume_day'].iloc[0]:,.0f}")
-c2.metric("7d Volume", f"{metrics['volume_week'].iloc[0]:,.0f}")
-c3.metric(f"{current_month} Volume", f"{metrics['volume_mtd'].iloc[0]:,.0f}")
-
-# Second row - User metrics
-c4, c5, c6 = st.columns(3)
-c4.metric("24h Users", f"{metrics['users_day'].iloc[0]:,.0f}")
-c5.metric("7d Users", f"{metrics['users_week'].iloc[0]:,.0f}")
-c6.metric(f"{current_month} Users", f"{metrics['users_mtd'].iloc[0]:,.0f}")
-
-# Third row - Trade count metrics
-c7, c8, c9 = st.columns(3)
-c7.metric("24h Trades", f"{metrics['trades_day'].iloc[0]:,.0f}")
-c8.metric("7d Trades", f"{metrics['trades_week'].iloc[0]:,.0f}")
-c9.metric(f"{current_month} Trades", f"{metrics['trades_mtd'].iloc[0]:,.0f}")
+# The page is laid out before any data is waited on: the metrics get their
+# slot first, so they show as soon as any source has them
+metrics_slot = st.empty()
+
+
+def show_metrics(metrics):
+    """Draw the three metric rows into metrics_slot, replacing its contents."""
+    with metrics_slot.container():
+        # First row - Volume metrics
+        c1, c2, c3 = st.columns(3)
+        c1.metric("24h Volume", f"{metrics.volume_day:,.0f}")
+        c2.metric("7d Volume", f"{metrics.volume_week:,.0f}")
+        c3.metric(f"{current_month} Volume", f"{metrics.volume_mtd:,.0f}")
+
+        # Second row - User metrics
+        c4, c5, c6 = st.columns(3)
+        c4.metric("24h Users", f"{metrics.users_day:,.0f}")
+        c5.metric("7d Users", f"{metrics.users_week:,.0f}")
+        c6.metric(f"{current_month} Users", f"{metrics.users_mtd:,.0f}")
+
+        # Third row - Trade count metrics
+        c7, c8, c9 = st.columns(3)
+        c7.metric("24h Trades", f"{metrics.trades_day:,.0f}")
+        c8.metric("7d Trades", f"{metrics.trades_week:,.0f}")
+        c9.metric(f"{current_month} Trades", f"{metrics.trades_mtd:,.0f}")
+
+
+# Fetches a rerun runs alongside its wait on the refresher
+@st.cache_resource
+def get_page_pool():
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="page-fetch")
+
+
+# Sessions opening during the same cold load share one metrics query
+EARLY_METRICS_TTL = 30
+
+
+def fetch_early_metrics(query_cache):
+    rows = query_cache.fetch(
+        metrics_query(since=history_start()),
+        lambda query: supabase.execute_sql(query, columns=METRICS_SCHEMA, label="early_metrics"),
+        ttl=EARLY_METRICS_TTL,
+    )
+    return metrics_from_rows(rows)
+
+
+# On a cold load the headline numbers are one small server-side aggregate,
+# far quicker than streaming every leg, so they are fetched alongside the
+# load and shown as soon as they arrive; the charts fill in below once the
+# first snapshot lands
+early_metrics = None
+if refresher.snapshot is None:
+    early_metrics = get_page_pool().submit(
+        contextvars.copy_context().run, fetch_early_metrics, get_query_cache()
+    )
+
+# Legs are streamed page by page; a cold load reports progress as they land
+load_status = st.empty()
+while not refresher.wait(ticket, timeout=0.1 if early_metrics is not None else 0.5):
+    if early_metrics is not None and early_metrics.done():
+        if early_metrics.exception() is None:
+            show_metrics(early_metrics.result())
+        early_metrics = None
+    load_status.caption(f"Loading trades... {refresher.progress:,} legs received")
+load_status.empty()
+
+snapshot = refresher.snapshot
+df = snapshot.legs
+aggregates = snapshot.aggregates
+if refresher.last_error is not None:
+    st.sidebar.warning(f"Last refresh failed, showing older data: {refresher.last_error}")
+st.sidebar.caption(
+    f"Data refreshed {refresher.age():,.0f}s ago · every {REFRESH_INTERVAL}s"
+)
+
+# Built figures are shared by every session and reused until the snapshot or
+# the chart's own controls change
+@st.cache_resource
+def get_figure_cache():
+    return FigureCache(max_bytes=64 * 1024 ** 2)
+
+
+figure_cache = get_figure_cache()
+
+
+def cached_figure(chart_id, params, build):
+    """Figure for chart_id at this snapshot; build() only runs on a cache miss."""
+    def timed_build():
+        with span("chart", chart_id):
+            return build()
+    return figure_cache.get(snapshot.built_at, chart_id, params, timed_build)
+
+
+# Drawn into the slot laid out before the data is waited on
+show_metrics(aggregates.metrics)
+
+@contextmanager
+def fragment_trace(name):
+    """Trace a fragment; fragment-only reruns skip the page's trace."""
+    trace = recorder.start_trace(name) if recorder.current_trace() is None else None
+    try:
+        yield
+    finally:
+        if trace is not None:
+            recorder.finish_trace(trace)
+
+
+# Live mode polls for trades newer than the snapshot; one poll per interval
+# serves every session watching
+LIVE_POLL_INTERVAL = st.secrets.get("live", {}).get("poll_interval_s", 5)
+
+
+@st.cache_resource
+def get_live_tail():
+    return LiveTail(supabase, poll_interval=LIVE_POLL_INTERVAL)
+
+
+def live_scatter(base_fig, plot_df, params):
+    """
+    This session's copy of base_fig with the trades that arrived after the
+    snapshot appended to it. Each update fetches and appends only the trades
+    the session has not drawn yet, continuing the cumulative volume.
+    """
+    state = st.session_state.get("live_scatter")
+    if state is None or state["key"] != (snapshot.built_at, params):
+        cumulative = plot_df['cumulative_volume'].max()
+        state = {
+            "key": (snapshot.built_at, params),
+            "fig": go.Figure(base_fig),
+            "seq": 0,
+            "cumulative": 0.0 if pd.isna(cumulative) else float(cumulative),
+        }
+        st.session_state["live_scatter"] = state
+    arrived, state["seq"] = get_live_tail().arrivals(snapshot.timeline.newest, state["seq"])
+    if len(arrived):
+        with span("chart", "trades_scatter.extend", rows=len(arrived)):
+            points = continuation(arrived, state["cumulative"])
+            extend_trades_scatter(state["fig"], points)
+            newest = points['cumulative_volume'].max()
+            if not pd.isna(newest):
+                state["cumulative"] = float(newest)
+    return state["fig"]
+
+
 ## PLOT 1
 st.markdown("<hr>", unsafe_allow_html=True)
 
-@st.cache_data
-def prepare_data(df, lookback_hours):
-    # Convert timestamp to datetime if it isn't already
-    df['block_timestamp'] = pd.to_datetime(df['block_timestamp'])
-    
-    # Calculate the cutoff time
-    cutoff_time = datetime.now() - timedelta(hours=lookback_hours)
-    
-    # Filter data based on lookback period
-    filtered_df = df[df['block_timestamp'] >= cutoff_time].copy()
-    
-    filtered_df = filtered_df[filtered_df['chain'].notna()]  # Remove null
-    filtered_df = filtered_df[filtered_df['chain'] != '']    # Remove empty strings
-
-    # Sort by timestamp (oldest first) for cumulative calculation
-    filtered_df = filtered_df.sort_values('block_timestamp')
-    
-    # Calculate cumulative volume
-    filtered_df['cumulative_volume'] = filtered_df['volume'].cumsum()
-    # Create log-scaled sizes for dots
-    # Simple log scaling for dot sizes
-    filtered_df['marker_size'] = 2**np.log(filtered_df['volume']/50+1)
-    # Clip to reasonable min/max sizes
-    filtered_df['marker_size'] = filtered_df['marker_size'].clip(4, 50)
-        
-    return filtered_df
-
-# Define chain colors
-chain_colors = {
-    'ethereum': '#627EEA',    # Ethereum blue
-    'polygon': '#8247E5',     # Polygon purple
-    'arbitrum': '#28A0F0',    # Arbitrum blue
-    'optimism': '#FF0420',    # Optimism red
-    'base': '#0052FF',        # Base blue
-    'avalanche': '#E84142',   # Avalanche red
-    'bsc': '#F3BA2F',         # BNB yellow
-    'celo': '#35D07F',        # Celo green
-    'solana': '#14F195'       # Solana green
-}
-
-# Time period selector 
-time_periods = {
-    "12 Hours": 12,
-    "24 Hours": 24,
-    "3 Days": 72,
-    "5 Days": 120,
-}
-
-selected_period = st.selectbox(
-    "Select Time Period",
-    options=list(time_periods.keys()),
-    index=1
+live = st.toggle(
+    "Live trades",
+    key="live_trades",
+    help=f"Add new trades to the chart every {LIVE_POLL_INTERVAL}s",
 )
 
-# Get the data with prepared marker sizes
-plot_df = prepare_data(df, time_periods[selected_period])
-
-# Create the figure directly with go.Figure
-fig = go.Figure()
-
-# Add scatter points for each chain
-for chain in plot_df['chain'].unique():
-    chain_data = plot_df[plot_df['chain'] == chain]
-    fig.add_trace(
-        go.Scatter(
-            x=chain_data['block_timestamp'],
-            y=chain_data['cumulative_volume'],
-            mode='markers',
-            name=chain,
-            marker=dict(
-                size=chain_data['marker_size'],  # Use our calculated sizes
-                opacity=0.8,
-                color=chain_colors.get(chain.lower(), '#808080')
-            ),
-            hovertemplate=(
-                
-                "Volume: $%{customdata[0]:,.2f}<br>" +
-                "Sender: %{customdata[1]}<br>" +
-                "Chain: %{text}<br>" +
-                "Time: %{x}<br>" +
-                "Transaction: %{customdata[2]}<br>" +
-                "Cumulative: $%{y:,.2f}"
-            ),
-            text=chain_data['chain'],
-            customdata=np.column_stack((chain_data['volume'],chain_data['wallet'],chain_data['transaction_hash']))
+
+# A fragment: changing the period or the detail window reruns only PLOT 1,
+# and in live mode it reruns on its own every poll interval
+@st.fragment(run_every=LIVE_POLL_INTERVAL if live else None)
+def trades_scatter_panel():
+    with fragment_trace("trades_scatter_panel"):
+        # Time period selector (the trade store keeps just enough history for the longest)
+        time_periods = LOOKBACK_HOURS
+
+        selected_period = st.selectbox(
+            "Select Time Period",
+            options=list(time_periods.keys()),
+            index=1
         )
-    )
-    fig.update_layout(
-    title={
-        'text': f'Mach Trades  [ {time_periods[selected_period]} hrs ]',
-        'y':0.95,
-        'x':0.5,
-        'xanchor': 'center',
-        'yanchor': 'top'
-    }
-    )
 
-# # Add the cumulative line
-# fig.add_trace(
-#     go.Scatter(
-#         x=plot_df['block_timestamp'],
-#         y=plot_df['cumulative_volume'],
-#         mode='lines',
-#         line=dict(color='white', width=1),
-#         name='Cumulative Volume',
-#         showlegend=False
-#     )
-# )
-
-# Update layout
-fig.update_layout(
-    plot_bgcolor='rgba(0,0,0,0)',
-    paper_bgcolor='rgba(0,0,0,0)',
-    xaxis_title="Time",
-    yaxis_title="Cumulative Volume",
-    showlegend=True,
-    legend_title="Chain",
-    hovermode='closest',
-    height=600,
-    template='plotly_dark',
-    legend=dict(
-        itemsizing='constant'
-    )
-)
+        # The snapshot's timeline is time sorted with marker sizes and running
+        # volume precomputed, so a lookback is a binary search plus a slice
+        with span("transform", "timeline.lookback"):
+            plot_df = snapshot.timeline.lookback(
+                time_periods[selected_period], now=snapshot.built_at
+            )
+
+        # Streamlit does not report plotly zoom events back to the script, so the
+        # detail window is picked with a slider: the chosen range is re-sliced from
+        # the full lookback and re-budgeted, giving full detail once it is narrow
+        zoom = None
+        # Whether the shown range runs up to the newest trade
+        at_newest = True
+        if len(plot_df) > SCATTER_POINT_BUDGET:
+            start = plot_df['block_timestamp'].iloc[0].to_pydatetime()
+            end = plot_df['block_timestamp'].iloc[-1].to_pydatetime()
+            zoom_start, zoom_end = st.slider(
+                "Detail window",
+                min_value=start,
+                max_value=end,
+                value=(start, end),
+                format="MMM DD, HH:mm",
+            )
+            zoom = (zoom_start, zoom_end)
+            at_newest = zoom_end == end
+            ts = plot_df['block_timestamp']
+            plot_df = plot_df.iloc[
+                ts.searchsorted(pd.Timestamp(zoom_start)):ts.searchsorted(pd.Timestamp(zoom_end), side='right')
+            ]
+
+        fig = cached_figure(
+            "trades_scatter",
+            (selected_period, zoom),
+            lambda: create_trades_scatter(plot_df, time_periods[selected_period]),
+        )
+
+        if live:
+            # A newer snapshot already holds the live trades: move the page to it
+            if refresher.snapshot is not snapshot:
+                st.rerun()
+            if at_newest and snapshot.timeline.newest is not None:
+                fig = live_scatter(fig, plot_df, (selected_period, zoom))
 
-# Add range slider
-fig.update_xaxes(rangeslider_visible=True)
+        # Display the plot
+        show_chart(fig, "trades_scatter", width="stretch")
 
-# Display the plot
-st.plotly_chart(fig, use_container_width=True)
+
+trades_scatter_panel()
 
 ## PLOT 2 Groupings
 st.markdown("<hr>", unsafe_allow_html=True)
 
-grouped_query = """
-with pre as (
-SELECT 
-    source_chain as chain,
-    source_id as asset,
-    source_volume as volume,
-    block_timestamp,
-    transaction_hash,
-    sender_address as wallet
-FROM public.main_volume_table
-UNION ALL
-SELECT 
-    dest_chain as chain,
-    dest_id as asset,
-    dest_volume as volume,
-    block_timestamp,
-    transaction_hash,
-    sender_address as wallet
-FROM public.main_volume_table
+# The default week is drawn from the exact 7 day aggregates; longer ranges
+# come from the aggregate pyramid at whatever resolution fits the range
+chart_range = st.selectbox(
+    "Select Chart Range",
+    options=list(CHART_RANGES.keys()),
+    index=0
 )
+range_length = CHART_RANGES[chart_range]
+range_start = None if range_length is None else snapshot.built_at - range_length
 
-SELECT 
-chain, 
-date_trunc('day', block_timestamp) as day,
-sum(volume) as total_volume
-FROM pre
-WHERE block_timestamp >= CURRENT_TIMESTAMP - INTERVAL '7 days' AND volume>0
-GROUP BY chain, date_trunc('day', block_timestamp) 
-ORDER BY 
-    date_trunc('day', block_timestamp) ASC, SUM(volume) DESC
-"""
-try:
-    bar_values = execute_sql(grouped_query)
-except Exception as e:
-    st.error(f"Error executing query: {str(e)}")
-
-
-
-def create_stacked_bar_chart(df):
-    # Ensure the 'day' column is in datetime format
-    df['day'] = pd.to_datetime(df['day'])
-    
-    # Helper function to add ordinal suffixes to the day number
-    def ordinal(n):
-        n = int(n)
-        if 11 <= (n % 100) <= 13:
-            suffix = "th"
-        else:
-            suffix = {1: "st", 2: "nd", 3: "rd"}.get(n % 10, "th")
-        return f"{n}{suffix}"
-    
-    # Create a new column for nicely formatted day labels (e.g., "Feb 1st")
-    df['day_label'] = df['day'].apply(lambda d: d.strftime("%b ") + ordinal(d.day))
-    
-    # Compute total volume per chain (across all days) and sort descending
-    chain_order = df.groupby('chain')['total_volume'].sum().sort_values(ascending=False)
-    sorted_chains = chain_order.index.tolist()
-    
-    # Create the figure
-    fig = go.Figure()
-    
-    # Add a trace for each chain in descending order so that the largest is on the bottom
-    for chain in sorted_chains:
-        chain_data = df[df['chain'] == chain].sort_values(by='day')
-        fig.add_trace(go.Bar(
-            name=chain.title(),  # Capitalize chain name
-            x=chain_data['day_label'],  # Use custom formatted date labels
-            y=chain_data['total_volume'],
-            marker_color=chain_colors.get(chain.lower(), '#000000'),  # Use defined color or default to black
-            marker_line=dict(color='black', width=1)  # Outline each bar with a black border
-        ))
-    
-    # Update layout: set stacking mode, adjust legend (left-to-right ordering), etc.
-    fig.update_layout(
-        title={
-            'text': 'Mach Volume by chain',
-            'y':0.95,
-            'x':0.5,
-            'xanchor': 'center',
-            'yanchor': 'top'
-        },
-        xaxis_title='Date',
-        yaxis_title='Volume',
-        barmode='stack',
-        showlegend=True,
-        legend=dict(
-            orientation="h",
-            yanchor="bottom",
-            y=1.02,
-            xanchor="left",  # Legend items start on the left
-            x=0
-        ),
-        xaxis=dict(
-            type='category',
-            tickangle=45
-        ),
-        height=600  # Make plot taller
-    )
-    
-    return fig
 
+def volume_bars(chart_id, group_col, build_default):
+    if range_length == CHART_WINDOW:
+        return cached_figure(chart_id, (), lambda: build_default(aggregates))
+    return cached_figure(
+        chart_id,
+        (chart_range,),
+        lambda: range_volume_chart(snapshot.pyramid, group_col, range_start, chart_range),
+    )
 
 
 # Create and show the chart
-fig = create_stacked_bar_chart(bar_values)
-st.plotly_chart(fig, use_container_width=True)
+fig = volume_bars("chain_bars", "chain", chain_volume_chart)
+show_chart(fig, "chain_bars", width="stretch")
+
+# Below the fold, each section is a collapsed panel inside its own fragment:
+# nothing in it is built until a viewer opens it, opening or closing it
+# reruns only that fragment, and once built its figures come from the
+# figure cache like every other chart's
 
 ## PLOT 2.5
 ## PLOT 2 Groupings
 st.markdown("<hr>", unsafe_allow_html=True)
 
-grouped2_query = """
-with pre as (
-SELECT 
-    source_chain as chain,
-    source_id as asset,
-    source_volume as volume,
-    block_timestamp,
-    transaction_hash,
-    sender_address as wallet
-FROM public.main_volume_table
-UNION ALL
-SELECT 
-    dest_chain as chain,
-    dest_id as asset,
-    dest_volume as volume,
-    block_timestamp,
-    transaction_hash,
-    sender_address as wallet
-FROM public.main_volume_table
-)
 
-SELECT 
-asset, 
-date_trunc('day', block_timestamp) as day,
-sum(volume) as total_volume
-FROM pre
-WHERE block_timestamp >= CURRENT_TIMESTAMP - INTERVAL '7 days' AND volume>0
-GROUP BY asset, date_trunc('day', block_timestamp) 
-ORDER BY 
-    date_trunc('day', block_timestamp) ASC, SUM(volume) DESC
-"""
-try:
-    asset_values = execute_sql(grouped2_query)
-except Exception as e:
-    st.error(f"Error executing query: {str(e)}")
-
-
-def create_stacked_bar_chart(df):
-    # Ensure the 'day' column is in datetime format
-    df['day'] = pd.to_datetime(df['day'])
-    
-    # Helper function to add ordinal suffixes to day numbers (e.g., 1st, 2nd)
-    def ordinal(n):
-        n = int(n)
-        if 11 <= (n % 100) <= 13:
-            suffix = "th"
-        else:
-            suffix = {1: "st", 2: "nd", 3: "rd"}.get(n % 10, "th")
-        return f"{n}{suffix}"
-    
-    # Create formatted day labels (e.g., "Feb 1st")
-    df['day_label'] = df['day'].apply(lambda d: d.strftime("%b ") + ordinal(d.day))
-    
-    # Calculate total volume per asset across all days
-    asset_totals = df.groupby('asset')['total_volume'].sum().sort_values(ascending=False)
-    # Determine the top 5 asset IDs
-    top_assets = asset_totals.head(5).index.tolist()
-    
-    # Create a new column 'asset_group': if the asset is in the top 5, keep it; otherwise, label it as 'Other'
-    df['asset_group'] = df['asset'].apply(lambda a: a if a in top_assets else 'Other')
-    
-    # Group by the new asset_group and day, summing total_volume so that non–top-5 assets aggregate as 'Other'
-    df_grouped = df.groupby(['asset_group', 'day']).agg({'total_volume': 'sum'}).reset_index()
-    
-    # Recreate the day_label for the grouped data
-    df_grouped['day_label'] = df_grouped['day'].apply(lambda d: d.strftime("%b ") + ordinal(d.day))
-    
-    # Determine the ordering of asset groups based on total volume.
-    # Top assets in descending order, then add 'Other' at the end (if present).
-    group_totals = df_grouped.groupby('asset_group')['total_volume'].sum()
-    sorted_groups = group_totals.drop('Other', errors='ignore').sort_values(ascending=False).index.tolist()
-    if 'Other' in group_totals:
-        sorted_groups.append('Other')
-    
-    # Create the Plotly figure
-    fig = go.Figure()
-    
-    for asset in sorted_groups:
-        asset_data = df_grouped[df_grouped['asset_group'] == asset].sort_values(by='day')
-        # Do not specify marker_color to use the default Plotly colors.
-        fig.add_trace(go.Bar(
-            name=str(asset),
-            x=asset_data['day_label'],
-            y=asset_data['total_volume'],
-            marker_line=dict(color='black', width=1)
-        ))
-    
-    # Update layout settings
-    fig.update_layout(
-        title={
-            'text': 'Mach Volume by Asset',
-            'y': 0.95,
-            'x': 0.5,
-            'xanchor': 'center',
-            'yanchor': 'top'
-        },
-        xaxis_title='Date',
-        yaxis_title='Volume',
-        barmode='stack',
-        showlegend=True,
-        legend=dict(
-            orientation="h",
-            yanchor="bottom",
-            y=1.02,
-            xanchor="left",
-            x=0
-        ),
-        xaxis=dict(
-            type='category',
-            tickangle=45
-        ),
-        height=600
-    )
-    
-    return fig
+@st.fragment
+def asset_bars_panel():
+    with fragment_trace("asset_bars_panel"):
+        panel = st.expander(
+            "Mach Volume by Asset", key="asset_bars_panel", on_change="rerun"
+        )
+        if panel.open:
+            # Create and display the chart in Streamlit.
+            fig = volume_bars("asset_bars", "asset", asset_volume_chart)
+            with panel:
+                show_chart(fig, "asset_bars", width="stretch")
+
 
-# Assuming bar_values is the DataFrame returned from your SQL query,
-# which contains columns: asset, day, total_volume, etc.
-# Create and display the chart in Streamlit.
-fig = create_stacked_bar_chart(asset_values)
-st.plotly_chart(fig, use_container_width=True)
+asset_bars_panel()
 
 ##END
 
@@ -522,243 +434,101 @@ st.plotly_chart(fig, use_container_width=True)
 ## PLOT 3
 st.markdown("<hr>", unsafe_allow_html=True)
 
-num_query = """
-WITH pre AS (
-    SELECT 
-        source_chain AS chain,
-        source_id AS asset,
-        source_volume AS volume,
-        block_timestamp,
-        transaction_hash,
-        sender_address AS wallet
-    FROM public.main_volume_table
-    UNION ALL
-    SELECT 
-        dest_chain AS chain,
-        dest_id AS asset,
-        dest_volume AS volume,
-        block_timestamp,
-        transaction_hash,
-        sender_address AS wallet
-    FROM public.main_volume_table
-)
 
-SELECT 
-    date_trunc('hour', block_timestamp) AS hour,
-    COUNT(DISTINCT transaction_hash) AS trades_count
-FROM pre
-WHERE block_timestamp >= CURRENT_TIMESTAMP - INTERVAL '7 days'
-  AND volume > 0
-GROUP BY date_trunc('hour', block_timestamp)
-ORDER BY hour ASC
-"""
+@st.fragment
+def cumulative_panel():
+    with fragment_trace("cumulative_panel"):
+        panel = st.expander(
+            "Cumulative Volume, Trades and Users Over the Last 7 Days",
+            key="cumulative_panel",
+            on_change="rerun",
+        )
+        if not panel.open:
+            return
 
-num_values = execute_sql(num_query)
+        # --- Create Figures for Each Metric ---
+        trades_fig = cached_figure("cumulative_trades", (), lambda: cumulative_trades_chart(aggregates))
+        volume_fig = cached_figure("cumulative_volume", (), lambda: cumulative_volume_chart(aggregates))
+        users_fig = cached_figure("cumulative_users", (), lambda: cumulative_users_chart(aggregates))
 
-def create_cumulative_line_chart(df):
-    """
-    Create a cumulative line chart of the number of trades over time.
-    
-    Parameters:
-    - df: pandas.DataFrame
-          A DataFrame with at least two columns:
-              'hour'         : timestamps (or strings convertible to datetime)
-              'trades_count' : the number of trades during that hour.
-    
-    Returns:
-    - fig: a Plotly Express figure object representing the cumulative trades over time.
-    """
-    # Convert the 'hour' column to datetime if not already in datetime format
-    df['hour'] = pd.to_datetime(df['hour'])
-    df = df.sort_values('hour')
-    
-    # Calculate the cumulative sum of trades
-    df['cumulative_trades'] = df['trades_count'].cumsum()
-    
-    # Create a line chart using Plotly Express
-    fig = px.line(
-        df,
-        x='hour',
-        y='cumulative_trades',
-        title='Cumulative Number of Trades Over the Last 7 Days',
-        labels={
-            'hour': 'Time',
-            'cumulative_trades': 'Cumulative Trades'
-        }
-    )
-    
-    # Update layout to adjust tick formatting and chart dimensions
-    fig.update_layout(
-        xaxis=dict(
-            tickformat="%b %d, %H:%M",  # e.g., "Feb 01, 14:00"
-            title='Time'
-        ),
-        yaxis_title='Cumulative Trades',
-        height=600
-    )
-    
-    return fig
-
-
-# --- Single Merged SQL Query ---
-merged_query = """
-WITH pre AS (
-    SELECT 
-        source_chain AS chain,
-        source_id AS asset,
-        source_volume AS volume,
-        block_timestamp,
-        transaction_hash,
-        sender_address AS wallet
-    FROM public.main_volume_table
-    UNION ALL
-    SELECT 
-        dest_chain AS chain,
-        dest_id AS asset,
-        dest_volume AS volume,
-        block_timestamp,
-        transaction_hash,
-        sender_address AS wallet
-    FROM public.main_volume_table
-)
-SELECT 
-    date_trunc('hour', block_timestamp) AS hour,
-    COUNT(DISTINCT transaction_hash) AS trades_count,
-    SUM(volume) AS volume_total,
-    json_agg(DISTINCT wallet) AS wallets
-
-FROM pre
-WHERE block_timestamp >= CURRENT_TIMESTAMP - INTERVAL '7 days'
-  AND volume > 0
-GROUP BY date_trunc('hour', block_timestamp)
-ORDER BY hour ASC
-"""
-
-# Execute the merged query to get the data
-data = execute_sql(merged_query)
-
-# --- Generic Cumulative Line Chart Function ---
-def create_cumulative_line_chart(df, metric_column, title, y_label):
-    """
-    Create a cumulative line chart for a given metric over time.
-    
-    Parameters:
-      - df: pandas.DataFrame with at least:
-            'hour' : timestamps (or strings convertible to datetime)
-            and a numeric column for the metric.
-      - metric_column: str, the column name to be cumulatively summed.
-      - title: str, the title of the chart.
-      - y_label: str, the y-axis label.
-    
-    Returns:
-      - fig: a Plotly Express figure object.
-    """
-    # Convert 'hour' to datetime if necessary and sort
-    df['hour'] = pd.to_datetime(df['hour'])
-    df = df.sort_values('hour')
-    
-    # Calculate cumulative sum for the specified metric
-    df['cumulative'] = df[metric_column].cumsum()
-    
-    # Create the line chart using Plotly Express
-    fig = px.line(
-        df,
-        x='hour',
-        y='cumulative',
-        title=title,
-        labels={'hour': 'Time', 'cumulative': y_label}
-    )
-    
-    # Update layout for improved readability
-    fig.update_layout(
-        xaxis=dict(
-            tickformat="%b %d, %H:%M",  # Example format: "Feb 01, 14:00"
-            title='Time'
-        ),
-        yaxis_title=y_label,
-        height=600
-    )
-    
-    return fig
+        # --- Display the Charts in Streamlit ---
+        # For example, show two charts side-by-side and the third one below
+        with panel:
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                show_chart(volume_fig, "cumulative_volume")
+            with col2:
+                show_chart(trades_fig, "cumulative_trades")
+            with col3:
+                show_chart(users_fig, "cumulative_users")
 
-def create_cumulative_users_line_chart(df):
-    """
-    Create a cumulative line chart of unique users over time.
-    
-    For each hour, this function updates a cumulative set of unique wallets
-    (parsed from a JSON array) so that each user is counted only once.
-    
-    Expects df to have:
-      - 'hour': timestamps
-      - 'wallets': a JSON array (or Python list) of wallet strings.
-    """
-    # Ensure 'hour' is datetime and sort the DataFrame by time
-    df['hour'] = pd.to_datetime(df['hour'])
-    df = df.sort_values('hour')
-    
-    cumulative_users = []
-    unique_users = set()
-    
-    # Iterate over each row to update the cumulative set of unique users
-    for wallets in df['wallets']:
-        # Some drivers return the JSON column as a string; if so, parse it.
-        if isinstance(wallets, str):
-            try:
-                wallets = json.loads(wallets)
-            except Exception:
-                wallets = []  # fallback in case of parsing issues
-        # Update the cumulative set with wallets from this hour
-        unique_users.update(wallets)
-        cumulative_users.append(len(unique_users))
-    
-    # Add the cumulative unique user counts to the DataFrame
-    df['cumulative_users'] = cumulative_users
-    
-    # Create a line chart for cumulative unique users
-    fig = px.line(
-        df,
-        x='hour',
-        y='cumulative_users',
-        title='New Unique Users Over the Last 7 Days',
-        labels={'hour': 'Time', 'cumulative_users': 'Cumulative Unique Users'}
-    )
-    
-    fig.update_layout(
-        xaxis=dict(
-            tickformat="%b %d, %H:%M",
-            title='Time'
-        ),
-        yaxis_title='Cumulative Unique Users',
-        height=600
-    )
-    
-    return fig
-
-# --- Create Figures for Each Metric ---
-trades_fig = create_cumulative_line_chart(
-    data.copy(), 
-    metric_column='trades_count', 
-    title='Cumulative Number of Trades Over the Last 7 Days',
-    y_label='Cumulative Trades'
-)
 
-volume_fig = create_cumulative_line_chart(
-    data.copy(), 
-    metric_column='volume_total', 
-    title='Cumulative Volume Over the Last 7 Days',
-    y_label='Cumulative Volume'
-)
+cumulative_panel()
 
-users_fig = create_cumulative_users_line_chart(data.copy())
 
+## PLOT 4
+st.markdown("<hr>", unsafe_allow_html=True)
+
+
+@st.fragment
+def user_mix_panel():
+    with fragment_trace("user_mix_panel"):
+        panel = st.expander(
+            "New vs Returning Users", key="user_mix_panel", on_change="rerun"
+        )
+        if not panel.open:
+            return
+
+        # Whether a wallet is new comes from its lifetime first trade, not
+        # just the legs held in memory
+        mix_fig = cached_figure(
+            "new_vs_returning", (), lambda: new_vs_returning_chart(snapshot.wallet_index, df)
+        )
+        retention_fig = cached_figure(
+            "cohort_retention", (), lambda: cohort_retention_chart(snapshot.wallet_index, df)
+        )
+        with panel:
+            col1, col2 = st.columns(2)
+            with col1:
+                show_chart(mix_fig, "new_vs_returning")
+            with col2:
+                show_chart(retention_fig, "cohort_retention")
 
-# --- Display the Charts in Streamlit ---
-# For example, show two charts side-by-side and the third one below
-col1, col2, col3 = st.columns(3)
-with col1:
-    st.plotly_chart(volume_fig)
-with col2:
-    st.plotly_chart(trades_fig)
-with col3:
-    st.plotly_chart(users_fig)
 
+user_mix_panel()
+
+
+## DEBUG TIMINGS
+recorder.finish_trace(trace)
+if st.sidebar.toggle("Debug timings"):
+    st.sidebar.caption(
+        f"This rerun: {trace.duration_s * 1000:,.0f} ms · figure cache "
+        f"{figure_cache.hits:,} hits / {figure_cache.misses:,} misses, "
+        f"{figure_cache.bytes / 1024 ** 2:,.1f} MB"
+    )
+    st.sidebar.dataframe(
+        pd.DataFrame(
+            [
+                {
+                    "kind": s.kind,
+                    "name": s.name,
+                    "label": s.attrs.get("label"),
+                    "ms": round(s.duration_s * 1000, 1),
+                    "rows": s.attrs.get("rows"),
+                    "bytes": s.attrs.get("bytes"),
+                }
+                for s in trace.spans
+            ]
+        ),
+        hide_index=True,
+    )
+    st.sidebar.download_button(
+        "Traces (JSON lines)",
+        recorder.to_jsonl(recorder.traces()),
+        file_name="dashboard_traces.jsonl",
+    )
+    st.sidebar.download_button(
+        "Totals (Prometheus)",
+        recorder.prometheus(),
+        file_name="dashboard_metrics.prom",
+    )
@@ -0,0 +1,186 @@
+"""
+In-process aggregations over the trade-leg frame.
+
+Everything the dashboard used to ask Supabase for in separate queries
+(``query_metrics``, ``grouped_query``, ``grouped2_query``, ``num_query`` and
+``merged_query``) is computed here from the one trade-leg DataFrame held in
+the local trade store, with the same filters and bucketing as the SQL.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from schema import category_codes
+from sketches import EXACT_LIMIT, build_sketch, distinct_wallets, running_distinct
+
+
+@dataclass(frozen=True)
+class Metrics:
+    """The nine headline numbers shown in the metrics rows."""
+
+    volume_day: float
+    volume_week: float
+    volume_mtd: float
+    users_day: int
+    users_week: int
+    users_mtd: int
+    trades_day: int
+    trades_week: int
+    trades_mtd: int
+
+
+# Column -> wire type of ``queries.metrics_query`` results
+METRICS_SCHEMA = {
+    "volume_day": pa.float64(),
+    "volume_week": pa.float64(),
+    "volume_mtd": pa.float64(),
+    "users_day": pa.int64(),
+    "users_week": pa.int64(),
+    "users_mtd": pa.int64(),
+    "trades_day": pa.int64(),
+    "trades_week": pa.int64(),
+    "trades_mtd": pa.int64(),
+}
+
+
+def metrics_from_rows(rows):
+    """Metrics from the one-row result of ``queries.metrics_query``."""
+    row = rows.iloc[0]
+    return Metrics(**{
+        name: (float if kind == pa.float64() else int)(
+            0 if pd.isna(row[name]) else pd.to_numeric(row[name])
+        )
+        for name, kind in METRICS_SCHEMA.items()
+    })
+
+
+@dataclass(frozen=True)
+class DashboardAggregates:
+    """
+    Everything the chart builders need, computed from one pass over the legs.
+
+    Attributes:
+      - metrics: Metrics for the 24h / 7d / month-to-date rows.
+      - chain_daily: columns chain, day, total_volume (last 7 days, volume > 0).
+      - asset_daily: columns asset, day, total_volume (last 7 days, volume > 0).
+      - hourly: columns hour, trades_count, volume_total, unique_wallets,
+                new_users (last 7 days, volume > 0).
+    """
+
+    metrics: Metrics
+    chain_daily: pd.DataFrame
+    asset_daily: pd.DataFrame
+    hourly: pd.DataFrame
+
+
+def _distinct_per(codes, key, col, index):
+    # COUNT(DISTINCT col) ... GROUP BY key, without per-group Python calls
+    valid = codes[codes[col] >= 0]
+    counts = valid.drop_duplicates([key, col]).groupby(key).size()
+    return counts.reindex(index, fill_value=0)
+
+
+def _daily_volume(recent, day, group_col):
+    # Matches: GROUP BY <group>, date_trunc('day', ...) ORDER BY day ASC, SUM(volume) DESC
+    out = (
+        recent.groupby([recent[group_col], day.rename("day")], observed=True, dropna=False)["volume"]
+        .sum()
+        .rename("total_volume")
+        .reset_index()
+    )
+    return out.sort_values(["day", "total_volume"], ascending=[True, False]).reset_index(drop=True)
+
+
+def metric_window_starts(now=None):
+    """
+    Exclusive start of the 24h, 7d and month-to-date metric windows: same
+    predicates as query_metrics (the month start is inclusive, so its
+    exclusive bound sits one tick earlier).
+    """
+    if now is None:
+        now = pd.Timestamp.now(tz="UTC")
+    return {
+        "day": now - pd.Timedelta(hours=24),
+        "week": now - pd.Timedelta(days=7),
+        "mtd": now.normalize().replace(day=1) - pd.Timedelta(1, unit="ns"),
+    }
+
+
+def compute_aggregates(df, now=None, sketches=None, metrics_engine=None):
+    """
+    Compute all dashboard aggregates from the trade-leg DataFrame.
+
+    Parameters:
+      - df: trade legs as laid out by ``schema.normalize_legs``.
+      - now: optional UTC timestamp to evaluate the windows at (defaults to now).
+      - sketches: optional ``sketches.HourlyWalletSketches``; when given,
+                  unique-user numbers over large ranges are estimated from the
+                  hourly wallet sketches instead of counted exactly.
+      - metrics_engine: optional ``metrics_engine.HourlyMetricsEngine``
+                        already updated with ``df``; when given, the headline
+                        metrics come from its hourly buckets.
+
+    Returns:
+      - DashboardAggregates
+    """
+    if now is None:
+        now = pd.Timestamp.now(tz="UTC")
+    ts = df["block_timestamp"]
+    wallet_codes = category_codes(df["wallet"])
+    tx_codes = category_codes(df["transaction_hash"])
+
+    if metrics_engine is not None:
+        metrics = metrics_engine.metrics(df, now)
+    else:
+        values = {}
+        for name, start in metric_window_starts(now).items():
+            mask = (ts > start).to_numpy()
+            values[f"volume_{name}"] = float(df["volume"][mask].sum())
+            values[f"users_{name}"] = distinct_wallets(df, start, sketches=sketches)
+            values[f"trades_{name}"] = int(np.count_nonzero(tx_codes[mask] >= 0))
+        metrics = Metrics(**values)
+
+    # Shared 7 day, positive volume slice for the bar and line charts
+    in_recent = ((ts >= now - pd.Timedelta(days=7)) & (df["volume"] > 0)).to_numpy()
+    recent = df[in_recent]
+    day = recent["day"]
+    hour = recent["hour"]
+
+    chain_daily = _daily_volume(recent, day, "chain")
+    asset_daily = _daily_volume(recent, day, "asset")
+
+    # Distinct counts run on the integer codes, not the strings
+    codes = pd.DataFrame({
+        "hour": hour.reset_index(drop=True),
+        "tx": tx_codes[in_recent],
+        "wallet": wallet_codes[in_recent],
+        "volume": recent["volume"].reset_index(drop=True),
+    })
+    hourly = pd.DataFrame({"volume_total": codes.groupby("hour")["volume"].sum()})
+    hourly.insert(0, "trades_count", _distinct_per(codes, "hour", "tx", hourly.index))
+    hourly["unique_wallets"] = _distinct_per(codes, "hour", "wallet", hourly.index)
+    hourly = hourly.sort_index()
+    if sketches is not None and len(recent) > EXACT_LIMIT:
+        # Running union of the stored hourly sketches. The first hour is only
+        # partly inside the window, so it is sketched from the raw legs.
+        registers = sketches.lookup(hourly.index, positive_volume=True)
+        if len(hourly):
+            first_hour = codes["hour"] == hourly.index[0]
+            registers[0] = build_sketch(recent[first_hour.to_numpy()], sketches.p)
+        cumulative = running_distinct(registers)
+        hourly["new_users"] = np.diff(cumulative, prepend=0)
+    else:
+        # A wallet is new in the hour it first shows up inside the window
+        with_wallet = codes[codes["wallet"] >= 0]
+        first_seen = with_wallet.groupby("wallet")["hour"].min()
+        hourly["new_users"] = first_seen.value_counts().reindex(hourly.index, fill_value=0)
+    hourly = hourly.reset_index()
+
+    return DashboardAggregates(
+        metrics=metrics,
+        chain_daily=chain_daily,
+        asset_daily=asset_daily,
+        hourly=hourly,
+    )
@@ -0,0 +1,143 @@
+"""
+Check the in-process aggregations in ``aggregations.py`` against the
+dashboard's original SQL.
+
+Loads a synthetic ``main_volume_table`` into DuckDB, reads the legs since
+``history_start`` (as the trade store does) and runs the original queries
+from ``check_queries.ORIGINAL_QUERIES`` at the same fixed "now". Then
+verifies that ``compute_aggregates``:
+
+  - gives the nine headline metrics of ``query_metrics``;
+  - gives the per-chain and per-asset daily volumes of ``grouped_query`` and
+    ``grouped2_query``;
+  - gives the hourly trades, volume and wallets of ``merged_query``, and new
+    users per hour (the hour each wallet first shows up inside the window);
+  - with the hourly wallet sketches and the metrics engine, gives the same
+    volumes and trade counts and wallet counts within the sketches' error.
+
+    python benchmarks/check_aggregations.py --rows 200000
+"""
+import argparse
+import dataclasses
+import os
+import sys
+import tempfile
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from aggregations import compute_aggregates, metrics_from_rows  # noqa: E402
+from check_queries import ORIGINAL_QUERIES, load_legs, load_table  # noqa: E402
+from metrics_engine import HourlyMetricsEngine  # noqa: E402
+from queries import history_start, legs_cte  # noqa: E402
+from sketches import HourlyWalletSketches  # noqa: E402
+
+# Three standard errors of the default p = 12 sketches
+SKETCH_RTOL = 0.05
+
+NEW_USERS_QUERY = """
+SELECT hour, count(*) AS new_users
+FROM (
+    SELECT wallet, min(date_trunc('hour', block_timestamp)) AS hour
+    FROM pre
+    WHERE block_timestamp >= CURRENT_TIMESTAMP - INTERVAL '7 days'
+      AND volume > 0 AND wallet IS NOT NULL
+    GROUP BY wallet
+) AS first_seen
+GROUP BY hour
+"""
+
+
+def run_original(con, body, now):
+    # Pin NOW() to the same instant compute_aggregates is given
+    pinned = f"TIMESTAMPTZ '{now.isoformat()}'"
+    query = legs_cte() + body.replace("NOW()", pinned).replace("CURRENT_TIMESTAMP", pinned)
+    return con.execute(query).df()
+
+
+def utc(values):
+    return pd.Series(values).astype("datetime64[ns, UTC]").array.asi8
+
+
+def report(label, n, unit, ok):
+    print(f"{label:<38}: {n:>7,} {unit:<7} {'OK' if ok else 'FAIL'}")
+    return not ok
+
+
+def compare_metrics(label, actual, expected, users_rtol=0.0):
+    ok = True
+    for name, value in dataclasses.asdict(expected).items():
+        rtol = users_rtol if name.startswith("users_") else 1e-9
+        ok &= bool(np.isclose(getattr(actual, name), value, rtol=rtol, atol=0))
+    return report(label, len(dataclasses.fields(expected)), "metrics", ok)
+
+
+def compare_daily(label, actual, expected, group_col):
+    # Ties on (day, total_volume) may come out in either order
+    actual = actual.sort_values(["day", group_col], key=lambda s: s.astype(str))
+    expected = expected.sort_values(["day", group_col], key=lambda s: s.astype(str))
+    ok = (
+        len(actual) == len(expected)
+        and np.array_equal(utc(actual["day"]), utc(expected["day"]))
+        and list(actual[group_col].astype(str)) == list(expected[group_col].astype(str))
+        and np.allclose(actual["total_volume"], expected["total_volume"], rtol=1e-9)
+    )
+    return report(label, len(actual), "rows", ok)
+
+
+def compare_hourly(label, hourly, expected, new_users, new_users_rtol=0.0):
+    new_users = new_users.set_index(utc(new_users["hour"]))["new_users"]
+    expected_new = new_users.reindex(utc(hourly["hour"]), fill_value=0).to_numpy()
+    ok = (
+        np.array_equal(utc(hourly["hour"]), utc(expected["hour"]))
+        and np.array_equal(hourly["trades_count"].to_numpy(), expected["trades_count"].to_numpy())
+        and np.allclose(hourly["volume_total"], expected["volume_total"], rtol=1e-9)
+        and np.array_equal(hourly["unique_wallets"].to_numpy(), expected["wallets"].to_numpy())
+        # Sketched new users are compared as a running total, whose error is
+        # the sketches' (per-hour differences of two estimates are noisier)
+        and np.allclose(np.cumsum(hourly["new_users"]), np.cumsum(expected_new),
+                        rtol=new_users_rtol, atol=0)
+    )
+    return report(label, len(hourly), "hours", ok)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    args = parser.parse_args()
+
+    con = duckdb.connect()
+    load_table(con, args.rows)
+    now = pd.Timestamp.now(tz="UTC")
+    legs = load_legs(con, history_start(now))
+
+    expected_metrics = metrics_from_rows(run_original(con, ORIGINAL_QUERIES["query_metrics"], now))
+    chain_daily = run_original(con, ORIGINAL_QUERIES["grouped_query"], now)
+    asset_daily = run_original(con, ORIGINAL_QUERIES["grouped2_query"], now)
+    hourly = run_original(con, ORIGINAL_QUERIES["merged_query"], now)
+    new_users = run_original(con, NEW_USERS_QUERY, now)
+
+    exact = compute_aggregates(legs, now=now)
+    failures = compare_metrics("metrics", exact.metrics, expected_metrics)
+    failures += compare_daily("chain daily volume", exact.chain_daily, chain_daily, "chain")
+    failures += compare_daily("asset daily volume", exact.asset_daily, asset_daily, "asset")
+    failures += compare_hourly("hourly series", exact.hourly, hourly, new_users)
+
+    with tempfile.TemporaryDirectory() as root:
+        sketches = HourlyWalletSketches(os.path.join(root, "wallet_sketches.npz"))
+        engine = HourlyMetricsEngine(sketches)
+        sketches.update(legs, version=1)
+        engine.update(legs, version=1)
+        sketched = compute_aggregates(legs, now=now, sketches=sketches, metrics_engine=engine)
+    failures += compare_metrics("metrics (engine, sketches)", sketched.metrics,
+                                expected_metrics, users_rtol=SKETCH_RTOL)
+    failures += compare_hourly("hourly series (sketches)", sketched.hourly, hourly,
+                               new_users, new_users_rtol=SKETCH_RTOL)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Check the aggregate pyramid in ``pyramid.py`` against the full table.
+
+Loads a synthetic ``main_volume_table`` into DuckDB, keeps only the legs
+since ``history_start`` (as the trade store does) and backfills older days
+from ``daily_totals_query``. Then verifies that:
+
+  - every tier's tiles equal a GROUP BY over the whole table at that
+    resolution (minute and hour tiles only for the legs they keep);
+  - folding the legs in two refreshes (an older cut, then a re-fetch window)
+    gives the same tiles as one full build;
+  - ranges from 1 hour to all time are answered with at most
+    ``max_points`` buckets.
+
+    python benchmarks/check_pyramid.py --rows 200000
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from check_queries import load_legs, load_table  # noqa: E402
+from pyramid import (  # noqa: E402
+    DEFAULT_MAX_POINTS,
+    DIMENSIONS,
+    AggregatePyramid,
+    fetch_daily_totals,
+)
+from queries import history_start, legs_query  # noqa: E402
+
+
+def expected_tiles(con, tier, dimension, since=None):
+    where = "" if since is None else f"WHERE block_timestamp >= '{since.isoformat()}'"
+    bucket = {
+        "minute": "date_trunc('minute', block_timestamp)",
+        "hour": "date_trunc('hour', block_timestamp)",
+        "day": "date_trunc('day', block_timestamp)",
+        # date_trunc('week') starts weeks on Mondays, like the pyramid
+        "week": "date_trunc('week', block_timestamp)",
+    }[tier.name]
+    return con.execute(f"""
+SELECT {bucket} AS bucket, {dimension} AS key, sum(volume) AS volume, count(*) AS legs
+FROM ({legs_query(positive_volume=True, ordered=False)}) AS legs
+{where}
+GROUP BY 1, 2
+ORDER BY 1, 2
+""").df()
+
+
+def compare(pyramid, con, legs_since):
+    failures = 0
+    for tier in pyramid.tiers:
+        for dimension in DIMENSIONS:
+            actual = pyramid._tiles[(tier.name, dimension)]
+            since = None
+            if tier.retention_ns is not None:
+                oldest = tier.floor(pyramid.through - tier.retention_ns)
+                since = max(legs_since, pd.Timestamp(oldest, tz="UTC"))
+            expected = expected_tiles(con, tier, dimension, since)
+            expected["bucket"] = expected["bucket"].astype("datetime64[ns, UTC]").array.asi8
+            if since is None and len(actual):
+                # Only the buckets a retention-less tier has seen
+                expected = expected[expected["bucket"] >= actual["bucket"].iloc[0]]
+            ok = (
+                len(actual) == len(expected)
+                and np.array_equal(actual["bucket"].to_numpy(), expected["bucket"].to_numpy())
+                and list(actual["key"]) == list(expected["key"])
+                and np.allclose(actual["volume"], expected["volume"], rtol=1e-9)
+                and np.array_equal(actual["legs"].to_numpy(), expected["legs"].to_numpy())
+            )
+            failures += not ok
+            print(f"{tier.name:>6} {dimension:<5}: {len(actual):>7,} tiles  {'OK' if ok else 'FAIL'}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    args = parser.parse_args()
+
+    con = duckdb.connect()
+    load_table(con, args.rows)
+    now = pd.Timestamp.now(tz="UTC")
+    since = history_start(now)
+    legs = load_legs(con, since)
+
+    def backfill(start, until):
+        return fetch_daily_totals(
+            lambda queries, columns: {key: con.execute(q).df() for key, q in queries.items()},
+            start, until,
+        )
+
+    with tempfile.TemporaryDirectory() as root:
+        print("one build:")
+        full = AggregatePyramid(os.path.join(root, "full"))
+        full.update(legs, version=1, backfill=backfill)
+        failures = compare(full, con, since)
+
+        print("two refreshes, reloaded from disk in between:")
+        cut = now - pd.Timedelta(hours=30)
+        older = legs[legs["block_timestamp"] < cut].reset_index(drop=True)
+        stepped = AggregatePyramid(os.path.join(root, "stepped"))
+        stepped.update(older, version=1, backfill=backfill)
+        stepped = AggregatePyramid(os.path.join(root, "stepped"))
+        stepped.update(legs, since=cut - pd.Timedelta(hours=6), version=2, backfill=backfill)
+        failures += compare(stepped, con, since)
+
+        for hours in (1, 6, 48, 24 * 7, 24 * 30, 24 * 90, None):
+            start = None if hours is None else now - pd.Timedelta(hours=hours)
+            tier, tiles = full.tiles("chain", start)
+            n = tiles["bucket"].nunique()
+            ok = n <= DEFAULT_MAX_POINTS
+            failures += not ok
+            print(f"range {'all time' if hours is None else f'{hours}h':>8}: "
+                  f"{tier:>6}, {n} buckets  {'OK' if ok else 'FAIL'}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Check that the query builder in ``queries.py`` returns the same rows as the
+dashboard's original SQL.
+
+Runs against a synthetic ``main_volume_table`` in DuckDB (the same stand-in
+the mock RPC uses) and verifies that:
+
+  - pushing the time and ``volume > 0`` predicates into each UNION branch
+    returns exactly the legs the original filter-after-UNION form returns;
+  - the original metrics, grouped and hourly queries give identical results
+    whether their ``pre`` CTE reads the whole table or only the legs since
+    ``history_start``, i.e. bounding the base fetch changes no panel.
+
+    python benchmarks/check_queries.py --rows 200000
+"""
+import argparse
+import os
+import sys
+
+import duckdb
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from queries import history_start, legs_cte, legs_query  # noqa: E402
+from schema import normalize_legs  # noqa: E402
+from synthetic import iter_main_volume_table  # noqa: E402
+
+# The dashboard's original queries, minus their `pre` CTE. json_agg(DISTINCT
+# wallet) is compared as a distinct count, which DuckDB can express.
+ORIGINAL_QUERIES = {
+    "query_metrics": """
+SELECT
+    sum(case when block_timestamp > NOW()- INTERVAL '24 hours' THEN volume ELSE 0 END) as volume_day,
+    sum(case when block_timestamp > NOW()- INTERVAL '7 days' THEN volume ELSE 0 END) as volume_week,
+    sum(case when block_timestamp >= DATE_TRUNC('month', NOW()) THEN volume ELSE 0 END) as volume_mtd,
+    COUNT(DISTINCT CASE WHEN block_timestamp > NOW() - INTERVAL '24 hours' THEN wallet END) AS users_day,
+    COUNT(DISTINCT CASE WHEN block_timestamp > NOW() - INTERVAL '7 days' THEN wallet END) AS users_week,
+    COUNT(DISTINCT CASE WHEN block_timestamp >= DATE_TRUNC('month', NOW()) THEN wallet END) AS users_mtd,
+    COUNT(CASE WHEN block_timestamp > NOW() - INTERVAL '24 hours' THEN transaction_hash END) AS trades_day,
+    COUNT(CASE WHEN block_timestamp > NOW() - INTERVAL '7 days' THEN transaction_hash END) AS trades_week,
+    COUNT(CASE WHEN block_timestamp >= DATE_TRUNC('month', NOW()) THEN transaction_hash END) AS trades_mtd
+FROM pre
+""",
+    "grouped_query": """
+SELECT chain, date_trunc('day', block_timestamp) as day, sum(volume) as total_volume
+FROM pre
+WHERE block_timestamp >= CURRENT_TIMESTAMP - INTERVAL '7 days' AND volume>0
+GROUP BY chain, date_trunc('day', block_timestamp)
+ORDER BY date_trunc('day', block_timestamp) ASC, SUM(volume) DESC, chain
+""",
+    "grouped2_query": """
+SELECT asset, date_trunc('day', block_timestamp) as day, sum(volume) as total_volume
+FROM pre
+WHERE block_timestamp >= CURRENT_TIMESTAMP - INTERVAL '7 days' AND volume>0
+GROUP BY asset, date_trunc('day', block_timestamp)
+ORDER BY date_trunc('day', block_timestamp) ASC, SUM(volume) DESC, asset
+""",
+    "merged_query": """
+SELECT
+    date_trunc('hour', block_timestamp) AS hour,
+    COUNT(DISTINCT transaction_hash) AS trades_count,
+    SUM(volume) AS volume_total,
+    COUNT(DISTINCT wallet) AS wallets
+FROM pre
+WHERE block_timestamp >= CURRENT_TIMESTAMP - INTERVAL '7 days'
+  AND volume > 0
+GROUP BY date_trunc('hour', block_timestamp)
+ORDER BY hour ASC
+""",
+}
+
+
+def load_table(con, rows):
+    con.execute("SET TimeZone='UTC'")
+    con.execute("CREATE SCHEMA public")
+    for i, chunk in enumerate(iter_main_volume_table(rows)):
+        con.register("chunk", chunk)
+        if i == 0:
+            con.execute("CREATE TABLE public.main_volume_table AS SELECT * FROM chunk")
+        else:
+            con.execute("INSERT INTO public.main_volume_table SELECT * FROM chunk")
+        con.unregister("chunk")
+
+
+def load_legs(con, since):
+    """The legs since ``since``, newest first, as the trade store holds them."""
+    legs = normalize_legs(con.execute(legs_query(since)).df())
+    return legs.reset_index(drop=True)
+
+
+def check_pushdown(con, now):
+    failures = 0
+    unfiltered = legs_query(ordered=False)
+    for since in (None, now - pd.Timedelta(days=7), now - pd.Timedelta(hours=120)):
+        for positive_volume in (False, True):
+            terms = []
+            if since is not None:
+                terms.append(f"block_timestamp >= '{since.isoformat()}'")
+            if positive_volume:
+                terms.append("volume > 0")
+            where = f"WHERE {' AND '.join(terms)}" if terms else ""
+            original = f"SELECT * FROM ({unfiltered}) AS legs {where}"
+            pushed = legs_query(since, positive_volume=positive_volume, ordered=False)
+            n = con.execute(f"SELECT count(*) FROM ({pushed})").fetchone()[0]
+            diff = con.execute(
+                f"SELECT count(*) FROM (({original}) EXCEPT ALL ({pushed})"
+                f" UNION ALL (({pushed}) EXCEPT ALL ({original})))"
+            ).fetchone()[0]
+            ok = diff == 0
+            failures += not ok
+            print(f"pushdown since={since} volume>0={positive_volume}: "
+                  f"{n:,} legs, {diff} differing  {'OK' if ok else 'FAIL'}")
+    return failures
+
+
+def check_history_bound(con, now):
+    failures = 0
+    full = legs_cte()
+    bounded = legs_cte(since=history_start(now))
+    for name, body in ORIGINAL_QUERIES.items():
+        expected = con.execute(full + body).df()
+        actual = con.execute(bounded + body).df()
+        try:
+            pd.testing.assert_frame_equal(expected, actual, check_exact=False, rtol=1e-9)
+            ok = True
+        except AssertionError:
+            ok = False
+        failures += not ok
+        print(f"history bound {name}: {len(expected)} rows  {'OK' if ok else 'FAIL'}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    args = parser.parse_args()
+
+    con = duckdb.connect()
+    load_table(con, args.rows)
+    now = pd.Timestamp.now(tz="UTC")
+    failures = check_pushdown(con, now) + check_history_bound(con, now)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Check the wallet index in ``wallet_index.py`` against the full table.
+
+Loads a synthetic ``main_volume_table`` into DuckDB, keeps only the legs
+since ``history_start`` (as the trade store does) and backfills the older
+wallets from ``wallet_history_query``. Then verifies that:
+
+  - the index equals a per-wallet GROUP BY over the whole table (first-seen
+    timestamp, first chain, trade count and volume);
+  - folding the legs in two refreshes (an older cut, then a re-fetch window
+    that overlaps it), reloaded from disk in between, gives the same index;
+  - the new-user counts, the new / returning split and the weekly cohort
+    retention match SQL, with no cohort older than the legs and the weeks
+    that have not happened yet left empty.
+
+    python benchmarks/check_wallet_index.py --rows 200000
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from check_queries import load_legs, load_table  # noqa: E402
+from queries import history_start, legs_query, wallet_history_query  # noqa: E402
+from wallet_index import WalletIndex, fetch_wallet_history  # noqa: E402
+
+
+def expected_index(con):
+    rows = con.execute(wallet_history_query()).df().set_index("wallet").sort_index()
+    rows["first_seen"] = rows["first_seen"].astype("datetime64[ns, UTC]")
+    return rows
+
+
+def compare(label, index, expected):
+    actual = index.table.sort_index()
+    ok = (
+        list(actual.index) == list(expected.index)
+        and np.array_equal(actual["first_seen"].array.asi8, expected["first_seen"].array.asi8)
+        and list(actual["first_chain"]) == list(expected["first_chain"])
+        and np.array_equal(actual["trades"].to_numpy(), expected["trades"].to_numpy())
+        and np.allclose(actual["volume"], expected["volume"], rtol=1e-9)
+    )
+    print(f"{label:<38}: {len(actual):>7,} wallets  {'OK' if ok else 'FAIL'}")
+    return not ok
+
+
+def check_new_users(con, index, legs, since):
+    failures = 0
+    expected = con.execute(f"""
+SELECT date_trunc('day', first_seen) AS day, count(*) AS n
+FROM ({wallet_history_query()}) AS w
+WHERE first_seen >= '{since.isoformat()}'
+GROUP BY 1 ORDER BY 1
+""").df()
+    actual = index.new_users(since, freq="D")
+    ok = (
+        np.array_equal(actual.index.asi8, expected["day"].astype("datetime64[ns, UTC]").array.asi8)
+        and np.array_equal(actual.to_numpy(), expected["n"].to_numpy())
+    )
+    failures += not ok
+    print(f"{'new users per day':<38}: {len(actual):>7,} days     {'OK' if ok else 'FAIL'}")
+
+    expected = con.execute(f"""
+WITH w AS ({wallet_history_query()}),
+active AS (
+    SELECT DISTINCT date_trunc('day', block_timestamp) AS day, wallet
+    FROM ({legs_query(since, ordered=False)}) AS legs
+    WHERE wallet IS NOT NULL
+)
+SELECT day, count(*) AS active,
+    count(CASE WHEN date_trunc('day', first_seen) = day THEN 1 END) AS new
+FROM active JOIN w USING (wallet)
+GROUP BY 1 ORDER BY 1
+""").df()
+    mix = index.activity_mix(legs, since, freq="D")
+    ok = (
+        np.array_equal(mix.index.asi8, expected["day"].astype("datetime64[ns, UTC]").array.asi8)
+        and np.array_equal(mix["active"].to_numpy(), expected["active"].to_numpy())
+        and np.array_equal(mix["new"].to_numpy(), expected["new"].to_numpy())
+    )
+    failures += not ok
+    print(f"{'new / returning per day':<38}: {len(mix):>7,} days     {'OK' if ok else 'FAIL'}")
+
+    # Cohorts start at the first whole week of the legs; weeks after the
+    # newest leg's week have not happened yet
+    retention = index.cohort_retention(legs)
+    oldest = legs["block_timestamp"].min()
+    first_cohort = oldest.floor("D") - pd.Timedelta(days=oldest.weekday())
+    if first_cohort < oldest:
+        first_cohort += pd.Timedelta(days=7)
+    expected = con.execute(f"""
+WITH w AS ({wallet_history_query()}),
+cohorts AS (
+    SELECT wallet, date_trunc('week', first_seen) AS cohort
+    FROM w WHERE first_seen >= '{first_cohort.isoformat()}'
+),
+sizes AS (SELECT cohort, count(*) AS size FROM cohorts GROUP BY 1),
+active AS (
+    SELECT DISTINCT date_trunc('week', block_timestamp) AS week, wallet
+    FROM ({legs_query(since, ordered=False)}) AS legs
+    WHERE wallet IS NOT NULL
+)
+SELECT cohort, date_diff('week', cohort, week) AS age, count(*) / any_value(size) AS share
+FROM active JOIN cohorts USING (wallet) JOIN sizes USING (cohort)
+GROUP BY 1, 2
+""").df()
+    expected["cohort"] = expected["cohort"].astype("datetime64[ns, UTC]")
+    expected = expected.pivot(index="cohort", columns="age", values="share")
+    expected = expected.reindex(index=retention.index, columns=retention.columns)
+    newest_week = (legs["block_timestamp"].max().floor("D")
+                   - pd.Timedelta(days=legs["block_timestamp"].max().weekday()))
+    future = np.array([
+        [cohort + pd.Timedelta(weeks=int(age)) > newest_week for age in retention.columns]
+        for cohort in retention.index
+    ], dtype=bool).reshape(retention.shape)
+    values = retention.to_numpy()
+    ok = (
+        len(retention) > 0
+        and retention.index[0] >= oldest
+        and np.allclose(values[:, 0], 1.0)
+        and np.isnan(values[future]).all()
+        and not np.isnan(values[~future]).any()
+        and np.allclose(values[~future], expected.fillna(0).to_numpy()[~future])
+    )
+    failures += not ok
+    print(f"{'cohort retention':<38}: {len(retention):>7,} cohorts  {'OK' if ok else 'FAIL'}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    args = parser.parse_args()
+
+    con = duckdb.connect()
+    load_table(con, args.rows)
+    now = pd.Timestamp.now(tz="UTC")
+    since = history_start(now)
+    legs = load_legs(con, since)
+    expected = expected_index(con)
+
+    def backfill(start, until):
+        return fetch_wallet_history(lambda query, columns: con.execute(query).df(), start, until)
+
+    with tempfile.TemporaryDirectory() as root:
+        full = WalletIndex(os.path.join(root, "full"))
+        full.update(legs, version=1, backfill=backfill)
+        failures = compare("one build", full, expected)
+
+        cut = now - pd.Timedelta(hours=30)
+        older = legs[legs["block_timestamp"] < cut].reset_index(drop=True)
+        stepped = WalletIndex(os.path.join(root, "stepped"))
+        stepped.update(older, since=cut - pd.Timedelta(hours=48), version=1, backfill=backfill)
+        stepped = WalletIndex(os.path.join(root, "stepped"))
+        stepped.update(legs, since=cut - pd.Timedelta(hours=6), version=2, backfill=backfill)
+        failures += compare("two refreshes, reloaded in between", stepped, expected)
+
+        failures += check_new_users(con, full, legs, since)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
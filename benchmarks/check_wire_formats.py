@@ -0,0 +1,66 @@
+"""
+Check that the csv and json wire formats decode to the same trade legs.
+
+Runs trade-leg rows through DuckDB and the mock RPC's response encoding in
+both formats (``csv_query`` for csv, the plain query for json) and compares the
+normalized frames column by column, including the edge cases the CSV text
+has to carry: SQL NULLs in every column, empty strings, and strings with
+quotes, commas and newlines. A NULL must come back as missing in both
+formats and an empty string as an empty string.
+
+    python benchmarks/check_wire_formats.py
+"""
+import os
+import sys
+
+import duckdb
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from mock_rpc import encode_rows  # noqa: E402
+from schema import LEG_COLUMNS, LEG_SCHEMA, normalize_legs  # noqa: E402
+from supabase_client import csv_query, decode_csv, decode_json_rows  # noqa: E402
+
+# One row per case; NULL in a different column each time
+ROWS = """
+SELECT * FROM (VALUES
+    ('ethereum', 'usdc', 10.5, TIMESTAMPTZ '2025-01-01 00:00:00+00', '0x01', '0xaa', 'source'),
+    (NULL, 'usdc', 1.0, TIMESTAMPTZ '2025-01-01 00:01:00+00', '0x02', NULL, 'dest'),
+    ('', '', 2.0, TIMESTAMPTZ '2025-01-01 00:02:00+00', '0x03', '', 'source'),
+    ('base', NULL, NULL, TIMESTAMPTZ '2025-01-01 00:03:00+00', NULL, '0xbb', 'dest'),
+    ('say "hi", then
+leave', 'a,b', 3.0, NULL, '0x05', '0xcc', NULL)
+) AS legs(chain, asset, volume, block_timestamp, transaction_hash, wallet, side)
+"""
+
+
+def same(a, b):
+    if a.isna().tolist() != b.isna().tolist():
+        return False
+    a, b = a[a.notna()], b[b.notna()]
+    if a.dtype.kind == "f":
+        return np.allclose(a.to_numpy(), b.to_numpy())
+    return a.astype(object).tolist() == b.astype(object).tolist()
+
+
+def main():
+    con = duckdb.connect()
+    con.execute("SET TimeZone='UTC'")
+    order = ["transaction_hash", "wallet"]
+    csv_body = encode_rows(con.execute(csv_query(ROWS, LEG_SCHEMA, order)).df())
+    json_body = encode_rows(con.execute(ROWS + f"ORDER BY {', '.join(order)}").df())
+    from_csv = normalize_legs(decode_csv(csv_body, LEG_SCHEMA))
+    from_json = normalize_legs(decode_json_rows(json_body))
+
+    failures = 0
+    for col in LEG_COLUMNS:
+        ok = same(from_csv[col], from_json[col])
+        failures += not ok
+        nulls = int(from_csv[col].isna().sum())
+        print(f"{col:<17}: {nulls} null  {'OK' if ok else 'FAIL'}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+End-to-end dashboard benchmark.
+
+For each table size a fresh subprocess loads a synthetic
+``main_volume_table`` into the DuckDB mock RPC (``mock_rpc.py``), points
+Graph-Dash.py at it through Streamlit's ``AppTest`` and times:
+
+  - cold_load: first script run against an empty trade store;
+  - warm_rerun: the same session rerun with nothing changed;
+  - period_change: the PLOT 1 period selector switched to "5 Days";
+  - aggregates, the trade timeline, a 120h lookback and each chart
+    builder, called directly on the stored legs (builder timings include
+    ``fig.to_json()``, which is what ``st.plotly_chart`` pays to serialize
+    the figure).
+
+Every scenario reports latency, the process's peak RSS so far (a high-water
+mark, so it only grows within one size), the RPC calls and response bytes it
+caused, and the figure JSON bytes sent to the browser. Results are appended
+as JSON lines, tagged with the git commit, so runs from different commits
+can be compared.
+
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/dashboard_bench.py --sizes 10000 100000
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+APP = os.path.join(ROOT, "Graph-Dash.py")
+DEFAULT_OUT = os.path.join(HERE, "results.jsonl")
+
+
+def _peak_rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _chart_bytes(at):
+    return sum(len(chart.proto.spec) for chart in at.get("plotly_chart"))
+
+
+def run_size(n_rows):
+    """Run inside the child process: every scenario for one table size."""
+    from streamlit.testing.v1 import AppTest
+
+    from mock_rpc import MockRPC
+
+    records = []
+    rpc = MockRPC(n_rows).start()
+    workdir = tempfile.mkdtemp(prefix="dash-bench-")
+    # The trade store and wallet sketches are written relative to the cwd
+    os.chdir(workdir)
+
+    def record(scenario, seconds, payload_bytes, before, **extra):
+        calls, sent = rpc.counters()
+        records.append({
+            "rows": n_rows,
+            "scenario": scenario,
+            "latency_s": round(seconds, 4),
+            "peak_rss_mb": _peak_rss_mb(),
+            "rpc_calls": calls - before[0],
+            "rpc_bytes": sent - before[1],
+            "payload_bytes": payload_bytes,
+            **extra,
+        })
+
+    at = AppTest.from_file(APP, default_timeout=3600)
+    at.secrets["supabase"] = {"url": rpc.url, "key": "benchmark"}
+
+    def page_run(scenario, action):
+        before = rpc.counters()
+        start = time.perf_counter()
+        action()
+        elapsed = time.perf_counter() - start
+        record(scenario, elapsed, _chart_bytes(at), before,
+               exceptions=[e.value for e in at.exception])
+
+    # Time to first content of a cold load: the server-side metrics aggregate
+    # the page shows while the legs stream in
+    from aggregations import METRICS_SCHEMA
+    from queries import history_start, metrics_query
+    from supabase_client import SupabaseClient
+
+    client = SupabaseClient(rpc.url, "benchmark", wire_format="csv")
+    before = rpc.counters()
+    start = time.perf_counter()
+    client.execute_sql(metrics_query(since=history_start()), columns=METRICS_SCHEMA)
+    record("early_metrics", time.perf_counter() - start, 0, before)
+    client.close()
+
+    page_run("cold_load", at.run)
+    page_run("warm_rerun", at.run)
+    page_run("period_change", lambda: at.selectbox[0].select("5 Days").run())
+
+    from aggregations import compute_aggregates
+    from charts import (
+        chain_colors,
+        create_cumulative_line_chart,
+        create_cumulative_users_line_chart,
+        create_stacked_bar_chart,
+        cohort_retention_chart,
+        create_trades_scatter,
+        new_vs_returning_chart,
+        range_volume_chart,
+    )
+    from pyramid import AggregatePyramid
+    from timeline import TradeTimeline
+    from trade_store import TradeStore
+    from wallet_index import WalletIndex
+
+    df = TradeStore(os.path.join(workdir, ".trade_store")).load()
+
+    before = rpc.counters()
+    start = time.perf_counter()
+    aggregates = compute_aggregates(df)
+    record("aggregates", time.perf_counter() - start, 0, before)
+
+    before = rpc.counters()
+    start = time.perf_counter()
+    timeline = TradeTimeline(df)
+    record("trade_timeline", time.perf_counter() - start, 0, before)
+
+    before = rpc.counters()
+    start = time.perf_counter()
+    plot_df = timeline.lookback(120)
+    record("lookback_120h", time.perf_counter() - start, 0, before)
+
+    before = rpc.counters()
+    start = time.perf_counter()
+    pyramid = AggregatePyramid(os.path.join(workdir, "pyramid"))
+    pyramid.update(df)
+    record("pyramid_build", time.perf_counter() - start, 0, before)
+
+    before = rpc.counters()
+    start = time.perf_counter()
+    pyramid.tiles("chain")
+    record("pyramid_range_all_time", time.perf_counter() - start, 0, before)
+
+    before = rpc.counters()
+    start = time.perf_counter()
+    wallet_index = WalletIndex(os.path.join(workdir, "wallet_index"))
+    wallet_index.update(df)
+    record("wallet_index_build", time.perf_counter() - start, 0, before)
+
+    builders = {
+        "chart_trades_scatter": lambda: create_trades_scatter(plot_df, 120),
+        "chart_chain_bars": lambda: create_stacked_bar_chart(
+            aggregates.chain_daily, "chain", "Mach Volume by chain",
+            colors=chain_colors, default_color="#000000", title_case=True,
+        ),
+        "chart_asset_bars": lambda: create_stacked_bar_chart(
+            aggregates.asset_daily, "asset", "Mach Volume by Asset", top_n=5,
+        ),
+        "chart_cumulative_trades": lambda: create_cumulative_line_chart(
+            aggregates.hourly.copy(), "trades_count",
+            "Cumulative Number of Trades Over the Last 7 Days", "Cumulative Trades",
+        ),
+        "chart_cumulative_volume": lambda: create_cumulative_line_chart(
+            aggregates.hourly.copy(), "volume_total",
+            "Cumulative Volume Over the Last 7 Days", "Cumulative Volume",
+        ),
+        "chart_cumulative_users": lambda: create_cumulative_users_line_chart(
+            aggregates.hourly.copy()
+        ),
+        "chart_chain_bars_all_time": lambda: range_volume_chart(
+            pyramid, "chain", None, "All Time"
+        ),
+        "chart_new_vs_returning": lambda: new_vs_returning_chart(wallet_index, df),
+        "chart_cohort_retention": lambda: cohort_retention_chart(wallet_index, df),
+    }
+    for scenario, build in builders.items():
+        before = rpc.counters()
+        start = time.perf_counter()
+        payload = build().to_json()
+        record(scenario, time.perf_counter() - start, len(payload), before)
+
+    rpc.stop()
+    os.chdir(HERE)
+    shutil.rmtree(workdir, ignore_errors=True)
+    return records
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(
+            ["git", "describe", "--always", "--dirty"], cwd=ROOT,
+            check=True, capture_output=True, text=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[10_000, 100_000, 1_000_000, 10_000_000])
+    parser.add_argument("--out", default=DEFAULT_OUT,
+                        help="JSON lines file the results are appended to")
+    parser.add_argument("--run", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run is not None:
+        print(json.dumps(run_size(args.run)))
+        return
+
+    run = {
+        "commit": _git_commit(),
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+    }
+    with open(args.out, "a") as out:
+        for n in args.sizes:
+            child = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--run", str(n)],
+                check=True, capture_output=True, text=True, cwd=HERE,
+            )
+            # Streamlit may log to stdout; the results are the last line
+            for rec in json.loads(child.stdout.strip().splitlines()[-1]):
+                rec = {**run, **rec}
+                out.write(json.dumps(rec) + "\n")
+                print(
+                    f"{rec['rows']:>10,}  {rec['scenario']:<26} "
+                    f"{rec['latency_s']:>9.3f}s  {rec['peak_rss_mb']:>8.1f} MB  "
+                    f"rpc {rec['rpc_bytes']:>12,} B  payload {rec['payload_bytes']:>10,} B",
+                    flush=True,
+                )
+
+
+if __name__ == "__main__":
+    main()
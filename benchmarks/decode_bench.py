@@ -0,0 +1,128 @@
+"""
+Decode benchmark for the execute_sql wire formats.
+
+Builds synthetic response bodies for N trade legs in the native JSON row
+format and in the CSV format produced by ``supabase_client.csv_query``, then
+decodes each body into the store's typed trade-leg frame in a fresh
+subprocess so peak RSS is measured per case.
+
+    python benchmarks/decode_bench.py --sizes 100000 1000000 10000000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+CHUNK = 100_000
+
+
+def _synthetic_chunk(rng, start, n):
+    ts = pd.Timestamp("2025-01-01", tz="UTC") + pd.to_timedelta(
+        rng.integers(0, 90 * 86400 * 10 ** 6, n), unit="us"
+    )
+    return {
+        "chain": rng.choice(["ethereum", "base", "arbitrum", "solana"], n),
+        "asset": rng.choice([f"0x{i:040x}" for i in range(50)], n),
+        "volume": np.round(rng.pareto(1.2, n) * 100, 6),
+        "block_timestamp": ts,
+        "transaction_hash": [f"0x{i:064x}" for i in range(start, start + n)],
+        "wallet": [f"0x{w:040x}" for w in rng.integers(0, max(n // 5, 1), n)],
+        "side": rng.choice(["source", "dest"], n),
+    }
+
+
+def write_bodies(n, directory):
+    """Write the JSON-rows and CSV response bodies for ``n`` legs."""
+    rng = np.random.default_rng(0)
+    json_path = os.path.join(directory, f"rows_{n}.json")
+    csv_text_path = os.path.join(directory, f"csv_{n}.txt")
+    with open(json_path, "w") as rows_out, open(csv_text_path, "w") as csv_out:
+        rows_out.write("[")
+        for start in range(0, n, CHUNK):
+            cols = _synthetic_chunk(rng, start, min(CHUNK, n - start))
+            for i in range(len(cols["chain"])):
+                row = {
+                    "chain": cols["chain"][i],
+                    "asset": cols["asset"][i],
+                    "volume": float(cols["volume"][i]),
+                    "block_timestamp": cols["block_timestamp"][i].isoformat(),
+                    "transaction_hash": cols["transaction_hash"][i],
+                    "wallet": cols["wallet"][i],
+                    "side": cols["side"][i],
+                }
+                rows_out.write(("," if start or i else "") + json.dumps({"result": row}))
+                pg_ts = cols["block_timestamp"][i].strftime("%Y-%m-%d %H:%M:%S.%f") + "+00"
+                csv_out.write(
+                    f'"{row["chain"]}","{row["asset"]}","{row["volume"]}","{pg_ts}",'
+                    f'"{row["transaction_hash"]}","{row["wallet"]}","{row["side"]}"\n'
+                )
+        rows_out.write("]")
+    # The csv format arrives as one JSON string value
+    csv_path = os.path.join(directory, f"csv_{n}.json")
+    with open(csv_text_path) as f:
+        text = f.read().rstrip("\n")
+    with open(csv_path, "w") as f:
+        json.dump([{"result": {"csv": text}}], f)
+    os.remove(csv_text_path)
+    return {"json": json_path, "csv": csv_path}
+
+
+def decode_case(wire_format, path):
+    """Run inside the child process: decode one body and report stats."""
+    from supabase_client import decode_csv, decode_json_rows
+    from schema import LEG_SCHEMA, normalize_legs
+
+    with open(path, "rb") as f:
+        body = f.read()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    if wire_format == "csv":
+        df = normalize_legs(decode_csv(body, LEG_SCHEMA))
+    else:
+        df = normalize_legs(decode_json_rows(body))
+    elapsed = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "format": wire_format,
+        "rows": len(df),
+        "body_mb": round(len(body) / 1024 ** 2, 1),
+        "decode_s": round(elapsed, 3),
+        "peak_rss_mb": round(rss_after / 1024, 1),
+        "decode_rss_mb": round((rss_after - rss_before) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[100_000, 1_000_000, 10_000_000])
+    parser.add_argument("--decode", nargs=2, metavar=("FORMAT", "PATH"),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.decode:
+        print(json.dumps(decode_case(*args.decode)))
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        for n in args.sizes:
+            for wire_format, path in write_bodies(n, directory).items():
+                out = subprocess.run(
+                    [sys.executable, __file__, "--decode", wire_format, path],
+                    check=True, capture_output=True, text=True,
+                )
+                print(out.stdout.strip(), flush=True)
+                os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
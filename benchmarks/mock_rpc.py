@@ -0,0 +1,132 @@
+"""
+Local stand-in for Supabase's ``/rest/v1/rpc/execute_sql`` endpoint.
+
+Queries run against an in-memory DuckDB database holding a synthetic
+``public.main_volume_table``. Responses use the RPC's wire shape (a JSON
+list of ``{"result": row}`` objects), so ``SupabaseClient`` talks to it
+unchanged in both wire formats. The server counts calls and response bytes
+so benchmarks can report network payload per scenario.
+
+    python benchmarks/mock_rpc.py --rows 100000 --port 8765
+"""
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import duckdb
+import pandas as pd
+
+from synthetic import iter_main_volume_table
+
+
+def encode_rows(df):
+    """Encode a result frame in the RPC's wire shape (SQL NULLs as null)."""
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.DatetimeTZDtype):
+            df[col] = df[col].map(lambda ts: ts.isoformat() if pd.notna(ts) else None)
+    rows = df.astype(object).where(df.notna(), None).to_dict("records")
+    return json.dumps([{"result": row} for row in rows], default=str).encode()
+
+
+class MockRPC:
+    """
+    DuckDB-backed ``execute_sql`` server on ``127.0.0.1``.
+
+    Parameters:
+      - rows: number of synthetic ``main_volume_table`` rows to load.
+      - port: TCP port; 0 picks a free one (see ``url``).
+      - seed: generator seed.
+    """
+
+    def __init__(self, rows, port=0, seed=0):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.bytes_sent = 0
+        self.con = duckdb.connect()
+        self.con.execute("SET TimeZone='UTC'")
+        self.con.execute("CREATE SCHEMA public")
+        for i, chunk in enumerate(iter_main_volume_table(rows, seed=seed)):
+            self.con.register("chunk", chunk)
+            if i == 0:
+                self.con.execute("CREATE TABLE public.main_volume_table AS SELECT * FROM chunk")
+            else:
+                self.con.execute("INSERT INTO public.main_volume_table SELECT * FROM chunk")
+            self.con.unregister("chunk")
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def execute(self, query):
+        """
+        Run ``query`` and return the encoded response body. Each query runs
+        on its own cursor, outside the lock, so concurrent requests are
+        served concurrently like the real endpoint.
+        """
+        with self._lock:
+            cursor = self.con.cursor()
+        try:
+            df = cursor.execute(query).df()
+        finally:
+            cursor.close()
+        body = encode_rows(df)
+        with self._lock:
+            self.calls += 1
+            self.bytes_sent += len(body)
+        return body
+
+    def counters(self):
+        """Return (calls, bytes_sent) so far."""
+        with self._lock:
+            return self.calls, self.bytes_sent
+
+    def _handler(self):
+        rpc = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers["Content-Length"])
+                query = json.loads(self.rfile.read(length))["query"]
+                try:
+                    body, status = rpc.execute(query), 200
+                except duckdb.Error as exc:
+                    body, status = json.dumps({"message": str(exc)}).encode(), 400
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.con.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    rpc = MockRPC(args.rows, port=args.port)
+    print(f"serving {args.rows:,} rows at {rpc.url}", flush=True)
+    rpc.server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
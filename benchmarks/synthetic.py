@@ -0,0 +1,71 @@
+"""
+Synthetic ``public.main_volume_table`` rows for benchmarks.
+
+Rows look like production traffic closely enough to exercise the same code
+paths: source/dest chains drawn from the dashboard's chain palette with a
+skewed mix, heavy-tailed (Pareto) volumes with a few zero-volume legs, a
+Zipf-like wallet population in which a few wallets trade a lot, and
+timestamps spread over the last ``days`` days with more activity towards the
+present.
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from charts import chain_colors  # noqa: E402
+
+CHUNK = 500_000
+N_ASSETS = 60
+
+# Relative share of legs per chain (same order as chain_colors)
+CHAIN_WEIGHTS = np.array([0.24, 0.10, 0.16, 0.10, 0.22, 0.05, 0.06, 0.02, 0.05])
+CHAINS = np.array(list(chain_colors))
+ASSETS = np.array([f"0x{i:040x}" for i in range(N_ASSETS)])
+
+
+def _wallet_population(n_rows):
+    # Roughly one distinct wallet per eight trades
+    return max(n_rows // 8, 10)
+
+
+def synthetic_chunk(rng, start, n, n_wallets, days=40, now=None):
+    """
+    Build ``n`` rows of ``main_volume_table`` whose transaction hashes start
+    at index ``start``.
+    """
+    now = pd.Timestamp.now(tz="UTC") if now is None else now
+    weights = CHAIN_WEIGHTS / CHAIN_WEIGHTS.sum()
+    asset_weights = 1.0 / np.arange(1, N_ASSETS + 1)
+    asset_weights /= asset_weights.sum()
+    # Ages skewed towards the present: the square of a uniform draw
+    age_s = (rng.random(n) ** 2) * days * 86400
+    wallet_ids = (rng.zipf(1.3, n) - 1) % n_wallets
+    # About 2% of legs carry no volume (e.g. failed or refunded fills)
+    source_volume = np.round(rng.pareto(1.2, n) * 50, 6) * (rng.random(n) >= 0.02)
+    dest_volume = np.round(rng.pareto(1.2, n) * 50, 6) * (rng.random(n) >= 0.02)
+    return pd.DataFrame({
+        "source_chain": rng.choice(CHAINS, n, p=weights),
+        "dest_chain": rng.choice(CHAINS, n, p=weights),
+        "source_id": rng.choice(ASSETS, n, p=asset_weights),
+        "dest_id": rng.choice(ASSETS, n, p=asset_weights),
+        "source_volume": source_volume,
+        "dest_volume": dest_volume,
+        "block_timestamp": now - pd.to_timedelta(age_s, unit="s"),
+        "transaction_hash": [f"0x{i:064x}" for i in range(start, start + n)],
+        "sender_address": [f"0x{w:040x}" for w in wallet_ids],
+    })
+
+
+def iter_main_volume_table(n_rows, seed=0, days=40, chunk=CHUNK):
+    """Yield ``n_rows`` synthetic rows as DataFrames of at most ``chunk`` rows."""
+    rng = np.random.default_rng(seed)
+    now = pd.Timestamp.now(tz="UTC")
+    n_wallets = _wallet_population(n_rows)
+    for start in range(0, n_rows, chunk):
+        yield synthetic_chunk(
+            rng, start, min(chunk, n_rows - start), n_wallets, days=days, now=now
+        )
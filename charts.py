@@ -0,0 +1,492 @@
+"""
+Plotly figure builders for the Mach dashboard.
+"""
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+from schema import CHAIN_KEYS
+
+# Define chain colors
+chain_colors = {
+    'ethereum': '#627EEA',    # Ethereum blue
+    'polygon': '#8247E5',     # Polygon purple
+    'arbitrum': '#28A0F0',    # Arbitrum blue
+    'optimism': '#FF0420',    # Optimism red
+    'base': '#0052FF',        # Base blue
+    'avalanche': '#E84142',   # Avalanche red
+    'bsc': '#F3BA2F',         # BNB yellow
+    'celo': '#35D07F',        # Celo green
+    'solana': '#14F195'       # Solana green
+}
+# Marker colors by the legs' color_idx; index -1 (a chain without a color) is grey
+CHAIN_PALETTE = [chain_colors[key] for key in CHAIN_KEYS] + ['#808080']
+
+# Above this many points the scatter is drawn with WebGL (Scattergl)
+SCATTER_GL_THRESHOLD = 2_000
+# Most points the scatter will ever send to the browser
+SCATTER_POINT_BUDGET = 8_000
+
+
+def downsample_trades(plot_df, point_budget=SCATTER_POINT_BUDGET):
+    """
+    Pick at most ``point_budget`` rows of a time-sorted trade frame.
+
+    Half of the budget keeps the largest trades (the big markers people look
+    for); the rest keeps the first and last trade of evenly sized buckets
+    along the cumulative volume curve, which preserves its shape because the
+    curve is monotonic. Returns the frame unchanged when it already fits.
+    """
+    n = len(plot_df)
+    if n <= point_budget:
+        return plot_df
+
+    volume = plot_df['volume'].to_numpy()
+    n_largest = point_budget // 2
+    largest = np.argpartition(volume, n - n_largest)[n - n_largest:]
+
+    n_buckets = max((point_budget - n_largest) // 2, 1)
+    edges = np.linspace(0, n, n_buckets + 1).astype(np.int64)
+    firsts = edges[:-1]
+    lasts = np.maximum(edges[1:] - 1, firsts)
+
+    keep = np.unique(np.concatenate([largest, firsts, lasts]))
+    return plot_df.iloc[keep]
+
+
+def _hover_data(chain_data):
+    return np.column_stack((chain_data['volume'],chain_data['wallet'],chain_data['transaction_hash']))
+
+
+def chain_trace(trace_type, chain, chain_data):
+    """One chain's markers in the "Mach Trades" scatter."""
+    return trace_type(
+        x=chain_data['block_timestamp'],
+        y=chain_data['cumulative_volume'],
+        mode='markers',
+        name=chain,
+        marker=dict(
+            size=chain_data['marker_size'],  # Use our calculated sizes
+            opacity=0.8,
+            color=CHAIN_PALETTE[chain_data['color_idx'].iat[0]]
+        ),
+        hovertemplate=(
+            "Volume: $%{customdata[0]:,.2f}<br>" +
+            "Sender: %{customdata[1]}<br>" +
+            "Chain: %{text}<br>" +
+            "Time: %{x}<br>" +
+            "Transaction: %{customdata[2]}<br>" +
+            "Cumulative: $%{y:,.2f}"
+        ),
+        text=chain_data['chain'],
+        customdata=_hover_data(chain_data)
+    )
+
+
+def create_trades_scatter(plot_df, lookback_hours,
+                          point_budget=SCATTER_POINT_BUDGET,
+                          gl_threshold=SCATTER_GL_THRESHOLD):
+    """
+    Build the "Mach Trades" cumulative volume scatter.
+
+    Parameters:
+      - plot_df: a ``TradeTimeline`` window (time sorted, with
+                 cumulative_volume and marker_size columns).
+      - lookback_hours: shown in the title.
+      - point_budget: cap on the number of markers sent to the browser.
+      - gl_threshold: switch to Scattergl when more points than this remain.
+    """
+    shown = downsample_trades(plot_df, point_budget)
+    trace_type = go.Scattergl if len(shown) > gl_threshold else go.Scatter
+
+    # Create the figure directly with go.Figure
+    fig = go.Figure()
+
+    # Add scatter points for each chain (one grouping pass over the chain codes)
+    for chain, chain_data in shown.groupby('chain', observed=True, sort=False):
+        fig.add_trace(chain_trace(trace_type, chain, chain_data))
+
+    title = f'Mach Trades  [ {lookback_hours} hrs ]'
+    if len(shown) < len(plot_df):
+        title += f'  ({len(shown):,} of {len(plot_df):,} trades shown)'
+
+    # Update layout
+    fig.update_layout(
+        title={
+            'text': title,
+            'y':0.95,
+            'x':0.5,
+            'xanchor': 'center',
+            'yanchor': 'top'
+        },
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        xaxis_title="Time",
+        yaxis_title="Cumulative Volume",
+        showlegend=True,
+        legend_title="Chain",
+        hovermode='closest',
+        height=600,
+        template='plotly_dark',
+        legend=dict(
+            itemsizing='constant'
+        )
+    )
+
+    # Add range slider
+    fig.update_xaxes(rangeslider_visible=True)
+
+    return fig
+
+
+def extend_trades_scatter(fig, points):
+    """
+    Append newly arrived trades to a "Mach Trades" scatter in place, the way
+    plotly.js extendTraces would: each chain's points go to the end of its
+    trace (a new trace for a chain not shown yet).
+
+    Parameters:
+      - fig: a figure from ``create_trades_scatter`` owned by the caller.
+      - points: rows from ``timeline.continuation`` (time sorted, with
+                cumulative_volume and marker_size columns).
+    """
+    traces = {trace.name: trace for trace in fig.data}
+    trace_type = type(fig.data[0]) if fig.data else go.Scatter
+    for chain, chain_data in points.groupby('chain', observed=True, sort=False):
+        trace = traces.get(chain)
+        if trace is None:
+            fig.add_trace(chain_trace(trace_type, chain, chain_data))
+            continue
+        trace.update(
+            # Plotly holds the times as naive UTC datetime64
+            x=np.concatenate([trace.x, chain_data['block_timestamp'].to_numpy(dtype='datetime64[ns]')]),
+            y=np.concatenate([trace.y, chain_data['cumulative_volume'].to_numpy()]),
+            text=np.concatenate([trace.text, chain_data['chain'].to_numpy(dtype=object)]),
+            customdata=np.concatenate([trace.customdata, _hover_data(chain_data)]),
+            marker_size=np.concatenate([trace.marker.size, chain_data['marker_size'].to_numpy()]),
+        )
+    return fig
+
+
+def day_labels(days):
+    """
+    Format day timestamps as e.g. "Feb 1st", vectorized over a DatetimeIndex.
+    """
+    day_of_month = days.day.to_numpy()
+    suffix = np.full(len(days), "th", dtype=object)
+    last_digit = day_of_month % 10
+    teen = (day_of_month % 100 >= 11) & (day_of_month % 100 <= 13)
+    suffix[(last_digit == 1) & ~teen] = "st"
+    suffix[(last_digit == 2) & ~teen] = "nd"
+    suffix[(last_digit == 3) & ~teen] = "rd"
+    return days.strftime("%b ").to_numpy(dtype=object) + day_of_month.astype(str).astype(object) + suffix
+
+
+def volume_matrix(df, group_col, top_n=None):
+    """
+    Pivot (group, day, total_volume) rows into a day x group matrix.
+
+    Columns are ordered by total volume, largest first. With ``top_n``, every
+    group outside the largest ``top_n`` is summed into a trailing 'Other'
+    column.
+    """
+    matrix = df.pivot_table(
+        index='day', columns=group_col, values='total_volume',
+        aggfunc='sum', observed=True
+    ).sort_index()
+    matrix.columns = matrix.columns.astype(object)
+    totals = matrix.sum(axis=0).sort_values(ascending=False)
+    matrix = matrix[totals.index]
+    if top_n is not None and matrix.shape[1] > top_n:
+        other = matrix.iloc[:, top_n:].sum(axis=1, min_count=1)
+        matrix = matrix.iloc[:, :top_n]
+        matrix['Other'] = other
+    return matrix
+
+
+def create_stacked_bar_chart(df, group_col, title, colors=None, top_n=None,
+                             default_color=None, title_case=False):
+    """
+    Stacked daily volume bars, one trace per group, largest group at the bottom.
+
+    Parameters:
+      - df: rows of (group_col, day, total_volume), e.g.
+            ``DashboardAggregates.chain_daily`` or ``asset_daily``.
+      - group_col: 'chain' or 'asset'.
+      - title: chart title.
+      - colors: optional dict of lowercased group name -> color; when omitted
+                plotly's default colors are used.
+      - top_n: keep the ``top_n`` largest groups and bucket the rest as 'Other'.
+      - default_color: color for groups missing from ``colors``.
+      - title_case: capitalize group names in the legend.
+    """
+    matrix = volume_matrix(df, group_col, top_n)
+    # Labels are computed once per distinct day, not once per row
+    labels = day_labels(pd.DatetimeIndex(matrix.index))
+
+    fig = go.Figure()
+    for group in matrix.columns:
+        name = str(group)
+        bar = dict(
+            name=name.title() if title_case else name,
+            x=labels,
+            y=matrix[group].to_numpy(),
+            marker_line=dict(color='black', width=1)  # Outline each bar with a black border
+        )
+        if colors is not None:
+            bar['marker_color'] = colors.get(name.lower(), default_color)
+        fig.add_trace(go.Bar(**bar))
+
+    # Update layout: set stacking mode, adjust legend (left-to-right ordering), etc.
+    fig.update_layout(
+        title={
+            'text': title,
+            'y': 0.95,
+            'x': 0.5,
+            'xanchor': 'center',
+            'yanchor': 'top'
+        },
+        xaxis_title='Date',
+        yaxis_title='Volume',
+        barmode='stack',
+        showlegend=True,
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=1.02,
+            xanchor="left",  # Legend items start on the left
+            x=0
+        ),
+        xaxis=dict(
+            type='category',
+            tickangle=45
+        ),
+        height=600  # Make plot taller
+    )
+
+    return fig
+
+
+# --- Generic Cumulative Line Chart Function ---
+def create_cumulative_line_chart(df, metric_column, title, y_label):
+    """
+    Create a cumulative line chart for a given metric over time.
+    
+    Parameters:
+      - df: pandas.DataFrame with at least:
+            'hour' : timestamps (or strings convertible to datetime)
+            and a numeric column for the metric.
+      - metric_column: str, the column name to be cumulatively summed.
+      - title: str, the title of the chart.
+      - y_label: str, the y-axis label.
+    
+    Returns:
+      - fig: a Plotly Express figure object.
+    """
+    # Convert 'hour' to datetime if necessary and sort (on a copy, the input
+    # may be a shared snapshot)
+    df = df.assign(hour=pd.to_datetime(df['hour'])).sort_values('hour')
+    
+    # Calculate cumulative sum for the specified metric
+    df['cumulative'] = df[metric_column].cumsum()
+    
+    # Create the line chart using Plotly Express
+    fig = px.line(
+        df,
+        x='hour',
+        y='cumulative',
+        title=title,
+        labels={'hour': 'Time', 'cumulative': y_label}
+    )
+    
+    # Update layout for improved readability
+    fig.update_layout(
+        xaxis=dict(
+            tickformat="%b %d, %H:%M",  # Example format: "Feb 01, 14:00"
+            title='Time'
+        ),
+        yaxis_title=y_label,
+        height=600
+    )
+    
+    return fig
+
+def create_cumulative_users_line_chart(df):
+    """
+    Create a cumulative line chart of unique users over time.
+    
+    Each wallet is counted once, in the hour it first appears in the window.
+    
+    Expects df to have:
+      - 'hour': timestamps
+      - 'new_users': number of wallets first seen in that hour.
+    """
+    # Ensure 'hour' is datetime and sort the DataFrame by time (on a copy)
+    df = df.assign(hour=pd.to_datetime(df['hour'])).sort_values('hour')
+    
+    # Running total of first appearances is the cumulative unique user count
+    df['cumulative_users'] = df['new_users'].cumsum()
+    
+    # Create a line chart for cumulative unique users
+    fig = px.line(
+        df,
+        x='hour',
+        y='cumulative_users',
+        title='New Unique Users Over the Last 7 Days',
+        labels={'hour': 'Time', 'cumulative_users': 'Cumulative Unique Users'}
+    )
+    
+    fig.update_layout(
+        xaxis=dict(
+            tickformat="%b %d, %H:%M",
+            title='Time'
+        ),
+        yaxis_title='Cumulative Unique Users',
+        height=600
+    )
+    
+    return fig
+
+
+def chain_volume_bars(daily, title='Mach Volume by chain'):
+    """Stacked volume by chain in the chain palette, from (chain, day, total_volume) rows."""
+    return create_stacked_bar_chart(
+        daily,
+        'chain',
+        title,
+        colors=chain_colors,
+        default_color='#000000',
+        title_case=True,
+    )
+
+
+def asset_volume_bars(daily, title='Mach Volume by Asset'):
+    """Stacked volume of the top 5 assets plus 'Other', from (asset, day, total_volume) rows."""
+    return create_stacked_bar_chart(
+        daily,
+        'asset',
+        title,
+        top_n=5,
+    )
+
+
+def chain_volume_chart(aggregates):
+    """PLOT 2: daily volume by chain, from ``DashboardAggregates``."""
+    return chain_volume_bars(aggregates.chain_daily)
+
+
+def asset_volume_chart(aggregates):
+    """PLOT 2.5: daily volume of the top 5 assets plus 'Other'."""
+    return asset_volume_bars(aggregates.asset_daily)
+
+
+# Bar width in the titles of pyramid-backed charts, by tier
+RESOLUTION_LABELS = {
+    'minute': 'per minute',
+    'hour': 'hourly',
+    'day': 'daily',
+    'week': 'weekly',
+}
+
+
+def range_volume_chart(pyramid, group_col, start, range_label):
+    """
+    PLOT 2 / 2.5 over any range, from the tiles of an ``AggregatePyramid``
+    (one bar per bucket of the tier it picks for the range).
+    """
+    tier, tiles = pyramid.tiles(group_col, start)
+    daily = tiles.rename(columns={'bucket': 'day', 'key': group_col, 'volume': 'total_volume'})
+    suffix = f'  [ {range_label}, {RESOLUTION_LABELS[tier]} ]'
+    if group_col == 'chain':
+        return chain_volume_bars(daily, 'Mach Volume by chain' + suffix)
+    return asset_volume_bars(daily, 'Mach Volume by Asset' + suffix)
+
+
+def cumulative_trades_chart(aggregates):
+    return create_cumulative_line_chart(
+        aggregates.hourly,
+        metric_column='trades_count',
+        title='Cumulative Number of Trades Over the Last 7 Days',
+        y_label='Cumulative Trades'
+    )
+
+
+def cumulative_volume_chart(aggregates):
+    return create_cumulative_line_chart(
+        aggregates.hourly,
+        metric_column='volume_total',
+        title='Cumulative Volume Over the Last 7 Days',
+        y_label='Cumulative Volume'
+    )
+
+
+def cumulative_users_chart(aggregates):
+    return create_cumulative_users_line_chart(aggregates.hourly)
+
+
+def new_vs_returning_chart(wallet_index, legs, start=None):
+    """
+    Daily active wallets of ``legs`` since ``start``, stacked as new (first
+    seen that day, per the ``WalletIndex``) and returning.
+    """
+    mix = wallet_index.activity_mix(legs, start, freq='D')
+    labels = day_labels(pd.DatetimeIndex(mix.index))
+    share = mix['returning_share'].to_numpy()
+    fig = go.Figure()
+    for column, name, color in (('returning', 'Returning', '#627EEA'),
+                                ('new', 'New', '#35D07F')):
+        fig.add_trace(go.Bar(
+            name=name,
+            x=labels,
+            y=mix[column].to_numpy(),
+            marker_color=color,
+            customdata=share,
+            hovertemplate='%{x}<br>' + name + ' users: %{y:,}'
+                          '<br>Returning share: %{customdata:.0%}<extra></extra>',
+        ))
+    fig.update_layout(
+        barmode='stack',
+        title='New vs Returning Users per Day',
+        xaxis_title='Date',
+        yaxis_title='Active Users',
+        height=500,
+    )
+    return fig
+
+
+def cohort_retention_chart(wallet_index, legs, start=None):
+    """
+    Weekly cohort retention heatmap: the share of the wallets first seen in
+    each week (rows) that trade again 1, 2, ... weeks later (columns).
+    """
+    retention = wallet_index.cohort_retention(legs, start)
+    values = retention.to_numpy()
+    fig = go.Figure(go.Heatmap(
+        z=values,
+        x=[f'Week {week}' for week in retention.columns],
+        y=[f'{day:%b %d}' for day in retention.index],
+        text=[['' if np.isnan(v) else f'{v:.0%}' for v in row] for row in values],
+        texttemplate='%{text}',
+        colorscale='Blues',
+        zmin=0,
+        zmax=1,
+        hovertemplate='Cohort of %{y}, %{x}: %{z:.1%}<extra></extra>',
+    ))
+    fig.update_layout(
+        title='Weekly Cohort Retention',
+        xaxis_title='Weeks Since First Trade',
+        yaxis=dict(title='Cohort (Week of First Trade)', autorange='reversed'),
+        height=500,
+    )
+    return fig
+
+
+# Dashboard panels drawn from the aggregates alone, by chart id, in page order
+AGGREGATE_CHARTS = {
+    "chain_bars": chain_volume_chart,
+    "asset_bars": asset_volume_chart,
+    "cumulative_volume": cumulative_volume_chart,
+    "cumulative_trades": cumulative_trades_chart,
+    "cumulative_users": cumulative_users_chart,
+}
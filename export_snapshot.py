@@ -0,0 +1,204 @@
+"""
+Headless export of the dashboard as static files.
+
+Loads the trade data once per run through the same pipeline as the
+Streamlit app (trade store, wallet sketches, metrics engine, aggregate
+pyramid, wallet index, aggregates) and renders every panel with the same
+chart builders, then writes:
+
+  - index.html: the metrics and all charts in one self-contained page;
+  - metrics.json: the nine headline numbers plus snapshot metadata;
+  - <chart id>.json: each figure as Plotly JSON, including one trades
+    scatter per selectable lookback (e.g. trades_scatter_24h.json) and the
+    volume bars of every longer chart range (e.g. chain_bars_90_days.json).
+
+Files are replaced atomically, so a web server can serve the directory to
+any number of viewers while it is being refreshed.
+
+    python export_snapshot.py --out-dir snapshots --interval 300
+
+Supabase credentials come from ``.streamlit/secrets.toml`` (as for the app)
+or the SUPABASE_URL / SUPABASE_KEY environment variables.
+"""
+import argparse
+import html
+import json
+import os
+import time
+import tomllib
+from dataclasses import asdict
+
+import plotly.io as pio
+
+from charts import (
+    AGGREGATE_CHARTS,
+    cohort_retention_chart,
+    create_trades_scatter,
+    new_vs_returning_chart,
+    range_volume_chart,
+)
+from metrics_engine import HourlyMetricsEngine
+from pyramid import AggregatePyramid
+from queries import CHART_RANGES, CHART_WINDOW, LOOKBACK_HOURS, history_start
+from query_cache import QueryCache
+from refresher import make_dashboard_refresh
+from sketches import HourlyWalletSketches
+from supabase_client import SupabaseClient
+from trade_store import TradeStore
+from wallet_index import WalletIndex
+
+# Panel shown for PLOT 1 in index.html (the app's default selection)
+DEFAULT_LOOKBACK = "24 Hours"
+
+METRIC_LABELS = [
+    ("volume", "Volume"),
+    ("users", "Users"),
+    ("trades", "Trades"),
+]
+
+
+def load_secrets(path):
+    """Supabase url / key / wire_format, from a secrets.toml and the env."""
+    section = {}
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            section = tomllib.load(f).get("supabase", {})
+    return {
+        "url": os.environ.get("SUPABASE_URL", section.get("url")),
+        "key": os.environ.get("SUPABASE_KEY", section.get("key")),
+        "wire_format": section.get("wire_format", "csv"),
+    }
+
+
+def render_figures(snapshot):
+    """Every dashboard figure for ``snapshot``, by chart id."""
+    figures = {}
+    for label, hours in LOOKBACK_HOURS.items():
+        plot_df = snapshot.timeline.lookback(hours, now=snapshot.built_at)
+        figures[f"trades_scatter_{hours}h"] = create_trades_scatter(plot_df, hours)
+    for chart_id, build in AGGREGATE_CHARTS.items():
+        figures[chart_id] = build(snapshot.aggregates)
+    for label, length in CHART_RANGES.items():
+        if length == CHART_WINDOW:
+            continue
+        start = None if length is None else snapshot.built_at - length
+        suffix = label.lower().replace(" ", "_")
+        for chart_id, group_col in (("chain_bars", "chain"), ("asset_bars", "asset")):
+            figures[f"{chart_id}_{suffix}"] = range_volume_chart(
+                snapshot.pyramid, group_col, start, label
+            )
+    figures["new_vs_returning"] = new_vs_returning_chart(snapshot.wallet_index, snapshot.legs)
+    figures["cohort_retention"] = cohort_retention_chart(snapshot.wallet_index, snapshot.legs)
+    return figures
+
+
+def metrics_table(metrics, month):
+    rows = []
+    for prefix, label in METRIC_LABELS:
+        cells = "".join(
+            f"<td><b>{html.escape(title)}</b><br>{getattr(metrics, f'{prefix}_{window}'):,.0f}</td>"
+            for window, title in (
+                ("day", f"24h {label}"),
+                ("week", f"7d {label}"),
+                ("mtd", f"{month} {label}"),
+            )
+        )
+        rows.append(f"<tr>{cells}</tr>")
+    return "<table class='metrics'>" + "".join(rows) + "</table>"
+
+
+def render_html(snapshot, figures, plotlyjs="inline"):
+    """One page with the metrics and every panel; plotly.js included once."""
+    month = snapshot.built_at.strftime("%B")
+    default_scatter = f"trades_scatter_{LOOKBACK_HOURS[DEFAULT_LOOKBACK]}h"
+    page = [default_scatter] + list(AGGREGATE_CHARTS) + ["new_vs_returning", "cohort_retention"]
+    include = True if plotlyjs == "inline" else "cdn"
+    parts = []
+    for chart_id in page:
+        parts.append(pio.to_html(
+            figures[chart_id], full_html=False, include_plotlyjs=include,
+            div_id=chart_id,
+        ))
+        include = False
+    return f"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Tristero's Mach Exchange</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+table.metrics td {{ padding: 12px 24px; }}
+</style>
+</head>
+<body>
+<h1>Tristero's Mach Exchange</h1>
+<p>Snapshot of {snapshot.built_at:%Y-%m-%d %H:%M} UTC</p>
+{metrics_table(snapshot.aggregates.metrics, month)}
+{"<hr>".join(parts)}
+</body>
+</html>
+"""
+
+
+def _write(path, text):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def export(snapshot, out_dir, plotlyjs="inline"):
+    """Write index.html, metrics.json and one JSON file per figure."""
+    os.makedirs(out_dir, exist_ok=True)
+    figures = render_figures(snapshot)
+    for chart_id, fig in figures.items():
+        _write(os.path.join(out_dir, f"{chart_id}.json"), pio.to_json(fig, validate=False))
+    _write(os.path.join(out_dir, "metrics.json"), json.dumps({
+        "built_at": snapshot.built_at.isoformat(),
+        "version": snapshot.version,
+        **asdict(snapshot.aggregates.metrics),
+    }))
+    # The page goes last, once everything it describes is in place
+    _write(os.path.join(out_dir, "index.html"), render_html(snapshot, figures, plotlyjs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--out-dir", default="snapshots")
+    parser.add_argument("--interval", type=float, default=300,
+                        help="seconds between exports; 0 exports once and exits")
+    parser.add_argument("--secrets", default=os.path.join(".streamlit", "secrets.toml"))
+    parser.add_argument("--store-dir", default=".export_store",
+                        help="trade store of this process (not shared with the app)")
+    parser.add_argument("--plotlyjs", choices=("inline", "cdn"), default="inline",
+                        help="embed plotly.js in index.html or load it from the CDN")
+    args = parser.parse_args()
+
+    secrets = load_secrets(args.secrets)
+    client = SupabaseClient(secrets["url"], secrets["key"], wire_format=secrets["wire_format"])
+    sketches = HourlyWalletSketches(os.path.join(args.store_dir, "wallet_sketches.npz"))
+    refresh = make_dashboard_refresh(
+        client,
+        QueryCache(probe_interval=30, default_ttl=300),
+        TradeStore(args.store_dir, history=history_start),
+        sketches,
+        HourlyMetricsEngine(sketches),
+        AggregatePyramid(os.path.join(args.store_dir, "pyramid")),
+        WalletIndex(os.path.join(args.store_dir, "wallet_index")),
+    )
+    try:
+        while True:
+            started = time.monotonic()
+            snapshot = refresh()
+            export(snapshot, args.out_dir, args.plotlyjs)
+            print(f"{snapshot.built_at:%Y-%m-%d %H:%M:%S} exported to {args.out_dir} "
+                  f"in {time.monotonic() - started:.1f}s", flush=True)
+            if args.interval <= 0:
+                break
+            time.sleep(max(args.interval - (time.monotonic() - started), 0))
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Process-wide cache of built Plotly figures.
+
+Figures are keyed by (data snapshot, chart id, view parameters), so a rerun
+that changes neither the data nor a chart's own controls reuses the figure
+instead of rebuilding it trace by trace, and every session viewing the same
+snapshot shares one copy.
+
+``st.plotly_chart`` only takes figure objects (or dicts it re-validates) and
+always serializes them itself with ``plotly.io.to_json``, so handing it
+cached JSON would add a parse and a validation on top of that serialization.
+The cache therefore keeps the built figures; each entry's size is an
+estimate of its serialized JSON (what the browser receives), taken from the
+lengths of its trace arrays when it is stored, and the total is bounded with
+least-recently-used eviction.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from query_cache import SingleFlight
+
+# Serialized layout of a figure (mostly its template), whatever its traces
+LAYOUT_BYTES = 7 * 1024
+# Items of non-numeric arrays (dates, labels, hashes) are sized from a sample
+SAMPLE_ITEMS = 64
+
+
+def _items_size(items):
+    if len(items) == 0:
+        return 2
+    sample = items[:SAMPLE_ITEMS]
+    # Quotes and separator around each item
+    per_item = sum(len(str(item)) for item in sample) / len(sample) + 3
+    return int(per_item * len(items))
+
+
+def _value_size(value):
+    if isinstance(value, dict):
+        return sum(_value_size(v) for v in value.values())
+    if isinstance(value, np.ndarray):
+        # Numeric arrays are sent base64-encoded, other ones item by item
+        if value.dtype.kind in "biuf":
+            return value.nbytes * 4 // 3
+        return _items_size(value.ravel())
+    if isinstance(value, (list, tuple)):
+        return _items_size(value)
+    return len(str(value)) + 3
+
+
+def estimate_size(fig):
+    """Approximate length of ``plotly.io.to_json(fig)``, without serializing."""
+    return LAYOUT_BYTES + sum(_value_size(trace.to_plotly_json()) for trace in fig.data)
+
+
+class FigureCache:
+    """
+    Byte-bounded LRU of Plotly figures.
+
+    Parameters:
+      - max_bytes: upper bound on the summed (estimated) serialized size of
+                   the figures.
+
+    Cached figures are shared: callers must not modify them.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._flight = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, snapshot_version, chart_id, params, build):
+        """
+        Return the figure for (snapshot_version, chart_id, params), calling
+        ``build()`` to make it on a miss. ``params`` must be hashable.
+        """
+        key = (snapshot_version, chart_id, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        def load():
+            fig = build()
+            size = estimate_size(fig)
+            with self._lock:
+                self._store(key, fig, size)
+            return fig
+
+        return self._flight.do(key, load)
+
+    def _store(self, key, fig, size):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+        self._entries[key] = (fig, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= evicted
+
+    @property
+    def bytes(self):
+        with self._lock:
+            return self._bytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
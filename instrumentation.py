@@ -0,0 +1,190 @@
+"""
+Lightweight timing spans for the dashboard's hot paths.
+
+A span times one unit of work: an ``execute_sql`` round trip (``query``),
+decoding or another data step (``transform``), building a Plotly figure
+(``chart``) or handing it to ``st.plotly_chart`` (``render``). Spans recorded
+while a trace is active on the current context (one trace per script rerun)
+are collected into it; work submitted to thread pools keeps the trace as long
+as it is submitted with a copied context (``contextvars.copy_context().run``).
+
+Every span, traced or not, also feeds process-wide per-(kind, name) totals,
+which ``Recorder.prometheus`` exposes in Prometheus text format. Finished
+traces are kept in a short ring buffer and can be exported as JSON lines.
+
+Recording a span costs two ``perf_counter`` calls and a locked dict update,
+so it is cheap enough to leave on.
+"""
+import contextvars
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+
+@dataclass(frozen=True)
+class Span:
+    """One timed unit of work."""
+
+    kind: str
+    name: str
+    started_at: float
+    duration_s: float
+    thread: str
+    attrs: dict
+
+
+@dataclass
+class Trace:
+    """The spans recorded during one script rerun."""
+
+    trace_id: int
+    name: str
+    started_at: float
+    duration_s: float = None
+    spans: list = field(default_factory=list)
+    _t0: float = field(default=0.0, repr=False)
+
+    def summary(self):
+        """Total seconds per (kind, name), largest first."""
+        totals = {}
+        for s in self.spans:
+            totals[(s.kind, s.name)] = totals.get((s.kind, s.name), 0.0) + s.duration_s
+        return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class Recorder:
+    """
+    Collects spans into per-rerun traces and process-wide totals.
+
+    Parameters:
+      - max_traces: number of finished traces kept for inspection.
+      - jsonl_path: optional file every finished trace is appended to, one
+                    JSON object per span.
+    """
+
+    def __init__(self, max_traces=50, jsonl_path=None):
+        self.jsonl_path = jsonl_path
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._traces = deque(maxlen=max_traces)
+        # (kind, name) -> [count, seconds, rows, bytes]
+        self._totals = {}
+
+    def start_trace(self, name="rerun"):
+        """Start a trace on the current context and return it."""
+        trace = Trace(next(self._ids), name, time.time(), _t0=time.perf_counter())
+        _current_trace.set(trace)
+        return trace
+
+    def finish_trace(self, trace=None):
+        """Close the current (or given) trace and keep it."""
+        trace = trace or _current_trace.get()
+        if trace is None:
+            return None
+        trace.duration_s = time.perf_counter() - trace._t0
+        if _current_trace.get() is trace:
+            _current_trace.set(None)
+        with self._lock:
+            self._traces.append(trace)
+        if self.jsonl_path is not None:
+            with open(self.jsonl_path, "a") as f:
+                f.write(self.to_jsonl([trace]))
+        return trace
+
+    @contextmanager
+    def span(self, kind, name, **attrs):
+        """
+        Time the enclosed block.
+
+        Yields the span's attribute dict, so callers can attach results that
+        are only known at the end (e.g. ``attrs["rows"] = len(df)``). ``rows``
+        and ``bytes`` attributes are also summed into the totals.
+        """
+        started_at = time.time()
+        t0 = time.perf_counter()
+        try:
+            yield attrs
+        finally:
+            duration = time.perf_counter() - t0
+            self._record(Span(
+                kind, name, started_at, duration,
+                threading.current_thread().name, attrs,
+            ))
+
+    def _record(self, span):
+        trace = _current_trace.get()
+        with self._lock:
+            if trace is not None:
+                trace.spans.append(span)
+            totals = self._totals.setdefault((span.kind, span.name), [0, 0.0, 0, 0])
+            totals[0] += 1
+            totals[1] += span.duration_s
+            totals[2] += span.attrs.get("rows", 0) or 0
+            totals[3] += span.attrs.get("bytes", 0) or 0
+
+    def current_trace(self):
+        """The trace active on the current context, if any."""
+        return _current_trace.get()
+
+    def traces(self):
+        """Finished traces, oldest first."""
+        with self._lock:
+            return list(self._traces)
+
+    @staticmethod
+    def to_jsonl(traces):
+        """Serialize traces as JSON lines, one object per span."""
+        lines = []
+        for trace in traces:
+            for s in trace.spans:
+                lines.append(json.dumps({
+                    "trace_id": trace.trace_id,
+                    "trace": trace.name,
+                    "trace_started_at": trace.started_at,
+                    "trace_duration_s": trace.duration_s,
+                    **asdict(s),
+                }, default=str))
+        return "".join(line + "\n" for line in lines)
+
+    def prometheus(self, prefix="dashboard"):
+        """Process-wide span totals in the Prometheus text exposition format."""
+        with self._lock:
+            totals = sorted(self._totals.items())
+        out = [
+            f"# HELP {prefix}_span_seconds Time spent in instrumented spans.",
+            f"# TYPE {prefix}_span_seconds summary",
+        ]
+        for (kind, name), (count, seconds, _, _) in totals:
+            labels = f'kind="{kind}",name="{_escape(name)}"'
+            out.append(f"{prefix}_span_seconds_sum{{{labels}}} {seconds:.6f}")
+            out.append(f"{prefix}_span_seconds_count{{{labels}}} {count}")
+        for metric, index, help_text in (
+            ("rows", 2, "Rows produced by instrumented spans."),
+            ("bytes", 3, "Bytes transferred by instrumented spans."),
+        ):
+            out.append(f"# HELP {prefix}_span_{metric}_total {help_text}")
+            out.append(f"# TYPE {prefix}_span_{metric}_total counter")
+            for (kind, name), values in totals:
+                if values[index]:
+                    labels = f'kind="{kind}",name="{_escape(name)}"'
+                    out.append(f"{prefix}_span_{metric}_total{{{labels}}} {values[index]}")
+        return "\n".join(out) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Process-wide default recorder
+recorder = Recorder()
+
+
+def span(kind, name, **attrs):
+    """``recorder.span`` on the process-wide recorder."""
+    return recorder.span(kind, name, **attrs)
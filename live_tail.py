@@ -0,0 +1,117 @@
+"""
+Trade legs newer than the published snapshot, for the live trades scatter.
+
+One ``LiveTail`` per server process asks Supabase for the legs after the
+newest one it holds (at most once per ``poll_interval``, however many
+sessions are watching) and buffers them until a snapshot includes them.
+Every buffered leg gets an arrival sequence number, so a session only takes
+the legs it has not drawn yet: each update queries and processes the new
+trades only.
+"""
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from query_cache import SingleFlight
+from queries import legs_query
+from schema import LEG_COLUMNS, LEG_SCHEMA, concat_legs, normalize_legs
+
+
+def _leg_keys(legs):
+    # A leg is identified by its timestamp, transaction and side
+    return list(zip(
+        legs["block_timestamp"].array.asi8.tolist(),
+        legs["transaction_hash"].astype(object).tolist(),
+        legs["side"].astype(object).tolist(),
+    ))
+
+
+class LiveTail:
+    """
+    Shared buffer of the legs that arrived after a snapshot.
+
+    Parameters:
+      - client: SupabaseClient to poll.
+      - poll_interval: minimum seconds between two polls.
+    """
+
+    def __init__(self, client, poll_interval=5):
+        self.client = client
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        # Newest leg timestamp (ns) of the snapshot the buffer continues
+        self.base = None
+        self.legs = normalize_legs(pd.DataFrame(columns=LEG_COLUMNS))
+        self._seq = np.zeros(0, dtype=np.int64)
+        self._next_seq = 1
+        self._keys = set()
+        self._polled_at = None
+
+    def _advance(self, base):
+        # A newer snapshot holds everything up to base; drop those legs
+        keep = (self.legs["block_timestamp"].array.asi8 > base)
+        self.legs = self.legs[keep].reset_index(drop=True)
+        self._seq = self._seq[keep]
+        self._keys = set(_leg_keys(self.legs))
+        self.base = base
+
+    def _poll(self):
+        with self._lock:
+            base = self.base
+            ts = self.legs["block_timestamp"].array.asi8
+            since = max(base, int(ts.max())) if ts.size else base
+        page = self.client.execute_sql(
+            legs_query(since=pd.Timestamp(since, tz="UTC"), ordered=False),
+            columns=LEG_SCHEMA,
+            label="live_tail",
+        )
+        arrived = normalize_legs(page).sort_values("block_timestamp", kind="stable")
+        with self._lock:
+            if self.base != base:
+                # A newer snapshot arrived meanwhile; the next poll catches up
+                return
+            arrived = arrived[arrived["block_timestamp"].array.asi8 > base]
+            keys = _leg_keys(arrived)
+            new = np.fromiter((key not in self._keys for key in keys), bool, len(keys))
+            arrived = arrived[new]
+            self._keys.update(key for key, is_new in zip(keys, new) if is_new)
+            seq = np.arange(self._next_seq, self._next_seq + len(arrived), dtype=np.int64)
+            self._next_seq += len(arrived)
+            self.legs = concat_legs([self.legs, arrived])
+            self._seq = np.concatenate([self._seq, seq])
+            self._polled_at = time.monotonic()
+
+    def arrivals(self, base, after_seq=0):
+        """
+        Legs newer than a snapshot, polling Supabase if the last poll is older
+        than ``poll_interval``.
+
+        Parameters:
+          - base: timestamp of the snapshot's newest leg.
+          - after_seq: last sequence number the caller has already taken.
+
+        Returns (legs oldest first, last sequence number). A caller on an
+        older snapshot than the buffer's gets no legs.
+        """
+        base = pd.Timestamp(base).value
+        with self._lock:
+            if self.base is None or base > self.base:
+                self._advance(base)
+                self._polled_at = None
+            elif base < self.base:
+                return self.legs.iloc[0:0], after_seq
+            due = (
+                self._polled_at is None
+                or time.monotonic() - self._polled_at >= self.poll_interval
+            )
+        if due:
+            self._flight.do(("live_tail",), self._poll)
+        with self._lock:
+            if self.base != base:
+                return self.legs.iloc[0:0], after_seq
+            new = self._seq > after_seq
+            last = int(self._seq[-1]) if self._seq.size else after_seq
+            return self.legs[new], max(last, after_seq)
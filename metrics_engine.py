@@ -0,0 +1,138 @@
+"""
+Incremental 24h / 7d / month-to-date metrics from hourly buckets.
+
+``HourlyMetricsEngine`` keeps a fixed-size ring buffer with one bucket per
+UTC hour: summed volume and leg count. Each refresh folds in only the hours
+the trade store re-fetched, and hours older than the ring's capacity (the
+current month plus 7 days) are overwritten as time moves on. Distinct
+wallets come from the per-hour sketches of ``sketches.HourlyWalletSketches``,
+which are kept for the same legs. The nine headline metrics are then sums /
+sketch merges over the hours; the one hour a window starts inside of is the
+only place raw legs are read, located by binary search on the sorted
+timestamps.
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+from aggregations import Metrics, metric_window_starts
+from schema import category_codes, distinct_count
+from sketches import EXACT_LIMIT, build_sketch, estimate
+from timebuckets import HOUR_NS, LegTimes, floor_ns, refresh_cutoff
+
+# Longest month plus a week, plus the hour a window starts inside of
+DEFAULT_CAPACITY = (31 + 7) * 24 + 1
+
+
+class HourlyMetricsEngine:
+    """
+    Ring buffer of per-hour (volume, legs) buckets.
+
+    Parameters:
+      - sketches: the ``HourlyWalletSketches`` updated from the same legs,
+                  merged for the distinct wallet counts.
+      - capacity: number of hourly buckets kept.
+    """
+
+    def __init__(self, sketches, capacity=DEFAULT_CAPACITY):
+        self.sketches = sketches
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self.version = None
+        self.newest_hour = None
+        # Hour start (ns) each slot currently holds, -1 when empty
+        self.hours = np.full(capacity, -1, dtype=np.int64)
+        self.volume = np.zeros(capacity)
+        self.trades = np.zeros(capacity, dtype=np.int64)
+
+    def _slot(self, hour_ns):
+        return (hour_ns // HOUR_NS) % self.capacity
+
+    def update(self, legs, since=None, version=None):
+        """
+        Fold the trade store's legs into the buckets.
+
+        Parameters:
+          - legs: every stored leg, newest first (``TradeStore.load``).
+          - since: re-fetch cutoff of the last store refresh; hours at or
+                   after its hour are rebuilt. None rebuilds every bucket.
+          - version: store generation (``TradeStore.generation``); nothing is
+                     done if it matches the last one.
+        """
+        with self._lock:
+            if version is not None and version == self.version:
+                return
+            times = LegTimes(legs)
+            if times.newest is None:
+                self.version = version
+                return
+            newest = floor_ns(times.newest, HOUR_NS)
+            oldest_kept = newest - (self.capacity - 1) * HOUR_NS
+            cutoff = refresh_cutoff(since, self.newest_hour, HOUR_NS)
+            if cutoff is None:
+                cutoff = oldest_kept
+                self.hours[:] = -1
+            else:
+                cutoff = max(cutoff, oldest_kept)
+
+            # Reset the buckets being rebuilt
+            rebuilt = np.arange(cutoff, newest + HOUR_NS, HOUR_NS, dtype=np.int64)
+            slots = self._slot(rebuilt)
+            self.hours[slots] = rebuilt
+            self.volume[slots] = 0
+            self.trades[slots] = 0
+
+            recent = times.since(cutoff)
+            row_slots = self._slot(recent["block_timestamp"].array.asi8)
+            volume = np.nan_to_num(recent["volume"].to_numpy(dtype=np.float64))
+            self.volume += np.bincount(row_slots, weights=volume, minlength=self.capacity)
+            has_tx = category_codes(recent["transaction_hash"]) >= 0
+            self.trades += np.bincount(row_slots[has_tx], minlength=self.capacity)
+
+            self.newest_hour = newest
+            self.version = version
+
+    def _window(self, times, start, exact_limit):
+        start_ns = pd.Timestamp(start).value
+        edge_hour = floor_ns(start_ns, HOUR_NS)
+        # Whole hours after the one the window starts in
+        full = self.hours > edge_hour
+
+        # Raw legs of the partial first hour (the window's start is exclusive)
+        in_window = times.since(start_ns + 1)
+        edge = times.between(start_ns + 1, edge_hour + HOUR_NS)
+
+        volume = float(self.volume[full].sum()) + float(np.nansum(edge["volume"].to_numpy()))
+        trades = int(self.trades[full].sum()) + int(
+            np.count_nonzero(category_codes(edge["transaction_hash"]) >= 0)
+        )
+        if len(in_window) <= exact_limit:
+            # Small windows are counted exactly from the raw legs
+            users = distinct_count(category_codes(in_window["wallet"]))
+        else:
+            first_full = pd.Timestamp(edge_hour + HOUR_NS, tz="UTC")
+            registers = np.maximum(
+                self.sketches.merged(first_full), build_sketch(edge, self.sketches.p)
+            )
+            users = int(estimate(registers)[0])
+        return volume, users, trades
+
+    def metrics(self, legs, now=None, exact_limit=EXACT_LIMIT):
+        """
+        The nine headline numbers at ``now`` (defaults to now), with the same
+        window predicates as ``aggregations.compute_aggregates``.
+
+        ``legs`` must be the frame last passed to ``update`` (and to the
+        sketches' ``update``); only the legs in each window's first partial
+        hour are read from it.
+        """
+        times = LegTimes(legs)
+        values = {}
+        with self._lock:
+            for name, start in metric_window_starts(now).items():
+                volume, users, trades = self._window(times, start, exact_limit)
+                values[f"volume_{name}"] = volume
+                values[f"users_{name}"] = users
+                values[f"trades_{name}"] = trades
+        return Metrics(**values)
@@ -0,0 +1,380 @@
+"""
+Multi-resolution volume tiles for arbitrary chart ranges.
+
+``AggregatePyramid`` keeps positive trade-leg volume and leg counts per
+(time bucket, chain) and per (time bucket, asset) at four resolutions:
+minute, hour, day and week. Each refresh only rebuilds the buckets at or
+after the trade store's re-fetch cutoff. Minute and hour tiles come from the
+raw legs; each coarser tier is re-bucketed from the tier below it, so day
+and week tiles outlive the legs the trade store keeps. The days before the
+store's history bound are filled in once, from server-side daily totals.
+
+A chart range is answered from the finest tier that covers it in at most
+``max_points`` buckets, so 30 days, 90 days or all time all cost a bounded
+slice of tiles, whatever the range.
+"""
+import json
+import os
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from queries import daily_totals_query
+from schema import category_codes
+from timebuckets import (
+    DAY_NS,
+    HOUR_NS,
+    MINUTE_NS,
+    WEEK_NS,
+    WEEK_ORIGIN_NS,
+    LegTimes,
+    floor_ns,
+    refresh_cutoff,
+)
+
+DIMENSIONS = ("chain", "asset")
+TILE_COLUMNS = ["bucket", "key", "volume", "legs"]
+# Most buckets a chart range is drawn with
+DEFAULT_MAX_POINTS = 120
+
+# Column -> wire type of ``daily_totals_query`` results
+DAILY_TOTALS_SCHEMA = {
+    "day": pa.timestamp("us", tz="UTC"),
+    "key": pa.string(),
+    "volume": pa.float64(),
+    "legs": pa.int64(),
+}
+
+
+@dataclass(frozen=True)
+class Tier:
+    """
+    One resolution of the pyramid.
+
+    Attributes:
+      - name: e.g. 'hour'.
+      - width_ns: bucket width.
+      - source: tier the buckets are re-bucketed from; None builds them from
+                the raw legs.
+      - retention_ns: how far behind the newest leg buckets are kept; None
+                      keeps them forever.
+      - origin_ns: offset of the bucket boundaries from the epoch.
+    """
+
+    name: str
+    width_ns: int
+    source: object = None
+    retention_ns: object = None
+    origin_ns: int = 0
+
+    def floor(self, ns):
+        """Start of the bucket holding ``ns`` (int or int64 array)."""
+        return floor_ns(ns, self.width_ns, self.origin_ns)
+
+
+TIERS = (
+    Tier("minute", MINUTE_NS, retention_ns=2 * DAY_NS),
+    Tier("hour", HOUR_NS, retention_ns=90 * DAY_NS),
+    Tier("day", DAY_NS, source="hour"),
+    Tier("week", WEEK_NS, source="day", origin_ns=WEEK_ORIGIN_NS),
+)
+# Tier the server-side daily totals are written to
+BACKFILL_TIER = "day"
+
+
+def _empty_tiles():
+    return pd.DataFrame({
+        "bucket": np.zeros(0, dtype=np.int64),
+        "key": pd.Series([], dtype=object),
+        "volume": np.zeros(0),
+        "legs": np.zeros(0, dtype=np.int64),
+    })
+
+
+def _summed(bucket, key, volume, legs):
+    # GROUP BY bucket, key; bucket ascending
+    frame = pd.DataFrame({"bucket": bucket, "key": key, "volume": volume, "legs": legs})
+    out = frame.groupby(["bucket", "key"], sort=True, observed=True).sum().reset_index()
+    out["key"] = out["key"].astype(object)
+    return out[TILE_COLUMNS]
+
+
+def leg_tiles(legs, dimension, tier):
+    """Sum the positive-volume legs into (bucket, key) tiles of ``tier``."""
+    ns = legs["block_timestamp"].array.asi8
+    volume = legs["volume"].to_numpy()
+    codes = category_codes(legs[dimension])
+    keep = (ns != pd.NaT.value) & (codes >= 0) & (volume > 0)
+    if not keep.any():
+        return _empty_tiles()
+    # Group on the category codes, then look the names up once per tile
+    key = pd.Categorical.from_codes(codes[keep], legs[dimension].cat.categories)
+    return _summed(tier.floor(ns[keep]), key, volume[keep], np.ones(keep.sum(), dtype=np.int64))
+
+
+def rebucket(tiles, tier):
+    """Re-bucket finer tiles into ``tier``."""
+    if tiles.empty:
+        return _empty_tiles()
+    return _summed(
+        tier.floor(tiles["bucket"].to_numpy()),
+        tiles["key"].to_numpy(),
+        tiles["volume"].to_numpy(),
+        tiles["legs"].to_numpy(),
+    )
+
+
+def fetch_daily_totals(execute_many, since=None, until=None):
+    """
+    Daily tiles per dimension from ``daily_totals_query``.
+
+    Parameters:
+      - execute_many: callable taking a dict of dimension -> SQL string and a
+                      ``columns`` keyword (dimension -> columns), and
+                      returning a dict of dimension -> DataFrame (e.g.
+                      ``SupabaseClient.execute_many``). The dimensions are
+                      independent queries, so they can run concurrently.
+    """
+    results = execute_many(
+        {dimension: daily_totals_query(dimension, since, until) for dimension in DIMENSIONS},
+        columns=dict.fromkeys(DIMENSIONS, DAILY_TOTALS_SCHEMA),
+    )
+    out = {}
+    for dimension in DIMENSIONS:
+        rows = results[dimension]
+        if rows.empty:
+            out[dimension] = _empty_tiles()
+            continue
+        day = pd.to_datetime(rows["day"], utc=True, format="ISO8601").astype("datetime64[ns, UTC]")
+        out[dimension] = _summed(
+            day.array.asi8,
+            rows["key"].astype(object).to_numpy(),
+            pd.to_numeric(rows["volume"]).astype("float64").to_numpy(),
+            pd.to_numeric(rows["legs"]).astype("int64").to_numpy(),
+        )
+    return out
+
+
+@dataclass(frozen=True)
+class PyramidView:
+    """
+    Read-only tiles of an ``AggregatePyramid`` at one update. Updates replace
+    the pyramid's tile frames instead of modifying them, so a view keeps
+    answering from the state it was taken at.
+
+    Attributes:
+      - tiers: resolutions, finest first.
+      - frames: (tier name, dimension) -> tile frame, buckets in ns.
+      - through: newest leg folded in (ns), None before the first update.
+    """
+
+    tiers: tuple
+    frames: dict
+    through: object
+
+    def tiles(self, dimension, start=None, end=None, max_points=DEFAULT_MAX_POINTS):
+        """
+        Tiles of ``dimension`` covering [start, end], from the finest tier that
+        needs at most ``max_points`` buckets (the coarsest otherwise).
+
+        ``start`` None means all time and ``end`` None the newest leg.
+        Returns (tier name, DataFrame of bucket, key, volume, legs) with
+        ``bucket`` as UTC timestamps, oldest first.
+        """
+        frames = self.frames
+        through = self.through
+        if through is None:
+            return self.tiers[-1].name, _empty_tiles()
+        end_ns = through if end is None else pd.Timestamp(end).value
+        if start is None:
+            # Oldest bucket of any tier
+            start_ns = min(
+                (int(frame["bucket"].iloc[0]) for frame in frames.values() if len(frame)),
+                default=end_ns,
+            )
+        else:
+            start_ns = pd.Timestamp(start).value
+
+        chosen = self.tiers[-1]
+        for tier in self.tiers:
+            frame = frames[(tier.name, dimension)]
+            # Tiers that drop old buckets only answer ranges they still hold
+            if tier.retention_ns is not None and (
+                frame.empty or tier.floor(start_ns) < frame["bucket"].iloc[0]
+            ):
+                continue
+            n_points = (tier.floor(end_ns) - tier.floor(start_ns)) // tier.width_ns + 1
+            if n_points <= max_points:
+                chosen = tier
+                break
+
+        frame = frames[(chosen.name, dimension)]
+        bucket = frame["bucket"].to_numpy()
+        lo = np.searchsorted(bucket, chosen.floor(start_ns), side="left")
+        hi = max(np.searchsorted(bucket, end_ns, side="right"), lo)
+        window = frame.iloc[lo:hi]
+        return chosen.name, window.assign(bucket=pd.to_datetime(window["bucket"], utc=True))
+
+
+class AggregatePyramid:
+    """
+    Persistent minute / hour / day / week volume tiles per chain and asset.
+
+    Parameters:
+      - root: directory the tiles are saved to (one Parquet file per tier and
+              dimension, plus meta.json).
+      - tiers: resolutions, finest first.
+    """
+
+    def __init__(self, root, tiers=TIERS):
+        self.root = root
+        self.tiers = tiers
+        self._lock = threading.Lock()
+        self.version = None
+        # Newest leg folded in (ns), and whether the days before the trade
+        # store's history have been filled in from the server
+        self.through = None
+        self.backfilled = False
+        self._tiles = {
+            (tier.name, dimension): _empty_tiles()
+            for tier in tiers for dimension in DIMENSIONS
+        }
+        os.makedirs(root, exist_ok=True)
+        self._read()
+
+    @property
+    def _meta_path(self):
+        return os.path.join(self.root, "meta.json")
+
+    def _tile_path(self, tier_name, dimension):
+        return os.path.join(self.root, f"{tier_name}_{dimension}.parquet")
+
+    def _read(self):
+        if not os.path.exists(self._meta_path):
+            return
+        with open(self._meta_path) as f:
+            meta = json.load(f)
+        if meta.get("tiers") != [tier.name for tier in self.tiers]:
+            return
+        for key in self._tiles:
+            path = self._tile_path(*key)
+            if os.path.exists(path):
+                tiles = pd.read_parquet(path)
+                tiles["key"] = tiles["key"].astype(object)
+                self._tiles[key] = tiles
+        self.through = meta["through"]
+        self.backfilled = meta["backfilled"]
+
+    def _write(self):
+        for key in self._tiles:
+            path = self._tile_path(*key)
+            tmp = path + ".tmp"
+            self._tiles[key].to_parquet(tmp, index=False)
+            os.replace(tmp, path)
+        tmp = self._meta_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({
+                "tiers": [tier.name for tier in self.tiers],
+                "through": self.through,
+                "backfilled": self.backfilled,
+            }, f)
+        os.replace(tmp, self._meta_path)
+
+    def _missing_days(self, legs_start):
+        # Days before the legs that the day tier has no tiles for
+        if not self.backfilled:
+            return None, legs_start
+        if self.through is not None and self.through < legs_start:
+            # e.g. the process was down for longer than the kept history
+            return floor_ns(self.through, DAY_NS), legs_start
+        return None
+
+    def update(self, legs, since=None, version=None, backfill=None):
+        """
+        Fold the trade store's legs into the tiles.
+
+        Parameters:
+          - legs: every stored leg, newest first (``TradeStore.load``).
+          - since: re-fetch cutoff of the last store refresh; buckets at or
+                   after it are rebuilt. None rebuilds every bucket the legs
+                   cover.
+          - version: store generation (``TradeStore.generation``); nothing is
+                     done if it matches the last one.
+          - backfill: optional callable taking (since, until) tz-aware
+                      timestamps (since may be None) and returning daily
+                      tiles per dimension (see ``fetch_daily_totals``); called
+                      for days before the legs the pyramid has never seen.
+        """
+        with self._lock:
+            if version is not None and version == self.version:
+                return
+            times = LegTimes(legs)
+            if times.newest is None:
+                self.version = version
+                return
+            newest = times.newest
+            legs_start = times.first_day
+            cutoff = refresh_cutoff(since, self.through)
+            cutoff = legs_start if cutoff is None else max(cutoff, legs_start)
+
+            tiles = dict(self._tiles)
+            rebuild_from = {tier.name: tier.floor(cutoff) for tier in self.tiers}
+            missing = None if backfill is None else self._missing_days(legs_start)
+            if missing is not None:
+                start, until = missing
+                daily = backfill(
+                    None if start is None else pd.Timestamp(start, tz="UTC"),
+                    pd.Timestamp(until, tz="UTC"),
+                )
+                lo = np.iinfo(np.int64).min if start is None else start
+                for dimension in DIMENSIONS:
+                    key = (BACKFILL_TIER, dimension)
+                    old = tiles[key]
+                    bucket = old["bucket"]
+                    tiles[key] = pd.concat([
+                        old[bucket < lo], daily[dimension], old[bucket >= until],
+                    ], ignore_index=True)
+                # Tiers built on top of the backfilled one are rebuilt from its start
+                names = [tier.name for tier in self.tiers]
+                for tier in self.tiers[names.index(BACKFILL_TIER) + 1:]:
+                    rebuild_from[tier.name] = (
+                        lo if start is None else min(rebuild_from[tier.name], tier.floor(start))
+                    )
+
+            # Legs from the earliest rebuilt leg-built bucket on
+            recent = times.since(min(
+                rebuild_from[tier.name] for tier in self.tiers if tier.source is None
+            ))
+            for tier in self.tiers:
+                start = rebuild_from[tier.name]
+                for dimension in DIMENSIONS:
+                    if tier.source is None:
+                        fresh = leg_tiles(recent, dimension, tier)
+                        fresh = fresh[fresh["bucket"] >= start]
+                    else:
+                        below = tiles[(tier.source, dimension)]
+                        fresh = rebucket(below[below["bucket"] >= start], tier)
+                    old = tiles[(tier.name, dimension)]
+                    merged = pd.concat([old[old["bucket"] < start], fresh], ignore_index=True)
+                    if tier.retention_ns is not None:
+                        oldest = tier.floor(newest - tier.retention_ns)
+                        merged = merged[merged["bucket"] >= oldest].reset_index(drop=True)
+                    tiles[(tier.name, dimension)] = merged
+
+            self._tiles = tiles
+            self.through = newest
+            self.backfilled = self.backfilled or backfill is not None
+            self.version = version
+            self._write()
+
+    def view(self):
+        """The tiles as of the last update, unaffected by later updates."""
+        with self._lock:
+            return PyramidView(self.tiers, self._tiles, self.through)
+
+    def tiles(self, dimension, start=None, end=None, max_points=DEFAULT_MAX_POINTS):
+        """Tiles of the current state; see ``PyramidView.tiles``."""
+        return self.view().tiles(dimension, start, end, max_points)
@@ -0,0 +1,172 @@
+"""
+SQL templates for the trade legs of ``public.main_volume_table``.
+
+Every query the dashboard sends is built from one leg template: each row of
+the table is two legs (source and dest), combined with UNION ALL. Predicates
+are pushed into every UNION branch, on the table's own columns, instead of
+being applied to the combined result, so the server can prune by
+``block_timestamp`` (and ``{side}_volume``) before it builds any legs.
+
+``history_start`` bounds which legs the dashboard fetches: nothing older
+than the longest selectable lookback, the 7 day charts or the month-to-date
+metrics is ever read leg by leg. Longer chart ranges are served from daily
+totals (``daily_totals_query``) and wallet history from per-wallet totals
+(``wallet_history_query``), both fetched once for the time before that bound.
+"""
+import pandas as pd
+
+SIDES = ("source", "dest")
+
+# Leg column -> expression on main_volume_table ({side} is source or dest)
+LEG_FIELDS = {
+    "chain": "{side}_chain",
+    "asset": "{side}_id",
+    "volume": "{side}_volume",
+    "block_timestamp": "block_timestamp",
+    "transaction_hash": "transaction_hash",
+    "wallet": "sender_address",
+    "side": "'{side}'",
+}
+
+# Lookbacks offered by the PLOT 1 period selector, in hours
+LOOKBACK_HOURS = {
+    "12 Hours": 12,
+    "24 Hours": 24,
+    "3 Days": 72,
+    "5 Days": 120,
+}
+# Window of the bar and line charts
+CHART_WINDOW = pd.Timedelta(days=7)
+# Ranges offered by the volume bar charts' range selector (None: all time)
+CHART_RANGES = {
+    "7 Days": CHART_WINDOW,
+    "30 Days": pd.Timedelta(days=30),
+    "90 Days": pd.Timedelta(days=90),
+    "All Time": None,
+}
+
+
+def sql_timestamp(ts):
+    """Quote a tz-aware timestamp as a SQL literal."""
+    return f"'{pd.Timestamp(ts).isoformat()}'"
+
+
+def leg_predicates(side, since=None, until=None, positive_volume=False):
+    """WHERE terms for one branch, on ``main_volume_table`` columns."""
+    terms = []
+    if since is not None:
+        terms.append(f"block_timestamp >= {sql_timestamp(since)}")
+    if until is not None:
+        terms.append(f"block_timestamp < {sql_timestamp(until)}")
+    if positive_volume:
+        terms.append(f"{side}_volume > 0")
+    return terms
+
+
+def leg_branch(side, since=None, until=None, positive_volume=False):
+    """The SELECT producing one side's legs, with its predicates applied."""
+    fields = ",\n".join(
+        f"    {expr.format(side=side)} as {col}" for col, expr in LEG_FIELDS.items()
+    )
+    terms = leg_predicates(side, since, until, positive_volume)
+    where = f"WHERE {' AND '.join(terms)}" if terms else ""
+    return f"""
+SELECT
+{fields}
+FROM public.main_volume_table
+{where}"""
+
+
+def legs_query(since=None, until=None, positive_volume=False, side=None,
+               ordered=True):
+    """
+    Build the query that returns one row per trade leg.
+
+    Parameters:
+      - since: optional tz-aware timestamp; only legs at or after it.
+      - until: optional tz-aware timestamp; only legs before it.
+      - positive_volume: only legs with volume > 0.
+      - side: 'source' or 'dest' to fetch a single leg; both legs are
+              combined with UNION ALL when omitted.
+      - ordered: append the newest-first ORDER BY (callers that page the
+                 query apply their own ordering).
+    """
+    sides = SIDES if side is None else (side,)
+    query = "\nUNION ALL".join(
+        leg_branch(s, since, until, positive_volume) for s in sides
+    )
+    if ordered:
+        query += "\nOrder by block_timestamp desc, transaction_hash"
+    return query + "\n"
+
+
+def legs_cte(name="pre", **kwargs):
+    """``WITH <name> AS (...)`` over ``legs_query`` (same keywords, unordered)."""
+    return f"WITH {name} AS ({legs_query(ordered=False, **kwargs)})\n"
+
+
+def metrics_query(since=None):
+    """
+    The nine headline metrics (see ``aggregations.Metrics``) in one
+    server-side aggregate over the legs since ``since``.
+    """
+    return legs_cte(since=since) + """
+SELECT
+    sum(case when block_timestamp > NOW() - INTERVAL '24 hours' THEN volume ELSE 0 END) AS volume_day,
+    sum(case when block_timestamp > NOW() - INTERVAL '7 days' THEN volume ELSE 0 END) AS volume_week,
+    sum(case when block_timestamp >= DATE_TRUNC('month', NOW()) THEN volume ELSE 0 END) AS volume_mtd,
+    COUNT(DISTINCT CASE WHEN block_timestamp > NOW() - INTERVAL '24 hours' THEN wallet END) AS users_day,
+    COUNT(DISTINCT CASE WHEN block_timestamp > NOW() - INTERVAL '7 days' THEN wallet END) AS users_week,
+    COUNT(DISTINCT CASE WHEN block_timestamp >= DATE_TRUNC('month', NOW()) THEN wallet END) AS users_mtd,
+    COUNT(CASE WHEN block_timestamp > NOW() - INTERVAL '24 hours' THEN transaction_hash END) AS trades_day,
+    COUNT(CASE WHEN block_timestamp > NOW() - INTERVAL '7 days' THEN transaction_hash END) AS trades_week,
+    COUNT(CASE WHEN block_timestamp >= DATE_TRUNC('month', NOW()) THEN transaction_hash END) AS trades_mtd
+FROM pre
+"""
+
+
+def daily_totals_query(dimension, since=None, until=None):
+    """
+    Per UTC day positive volume and leg count by ``dimension`` ('chain' or
+    'asset'), summed server side; one row per (day, key).
+    """
+    return legs_cte(since=since, until=until, positive_volume=True) + f"""
+SELECT date_trunc('day', block_timestamp) AS day, {dimension} AS key,
+    sum(volume) AS volume, count(*) AS legs
+FROM pre
+WHERE {dimension} IS NOT NULL
+GROUP BY 1, 2
+"""
+
+
+def wallet_history_query(since=None, until=None):
+    """
+    Per wallet: first leg timestamp, chain of that leg (the source leg when
+    both legs share the timestamp), trade count and summed leg volume, over
+    the legs in [since, until).
+    """
+    return legs_cte(since=since, until=until) + """
+SELECT wallet,
+    min(block_timestamp) AS first_seen,
+    (array_agg(chain ORDER BY block_timestamp, side DESC))[1] AS first_chain,
+    count(CASE WHEN side = 'source' THEN transaction_hash END) AS trades,
+    sum(volume) AS volume
+FROM pre
+WHERE wallet IS NOT NULL
+GROUP BY wallet
+"""
+
+
+def history_start(now=None, lookback_hours=max(LOOKBACK_HOURS.values())):
+    """
+    Oldest ``block_timestamp`` any panel reads at ``now``: the longest PLOT 1
+    lookback, the 7 day charts or the start of the month, whichever is
+    earliest, rounded down to the UTC day.
+    """
+    if now is None:
+        now = pd.Timestamp.now(tz="UTC")
+    return min(
+        now - pd.Timedelta(hours=lookback_hours),
+        now - CHART_WINDOW,
+        now.normalize().replace(day=1),
+    ).floor("D")
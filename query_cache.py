@@ -0,0 +1,169 @@
+"""
+Process-wide cache for Supabase query results.
+
+Entries expire after a per-query TTL and are also dropped as soon as the
+upstream data version changes. The data version comes from a cheap freshness
+probe (newest ``block_timestamp`` and row count of ``main_volume_table``)
+that is itself only re-run every ``probe_interval`` seconds, so reruns that
+only change presentation never touch the network. Total cached size is
+bounded and the least recently used entries are evicted first.
+
+Concurrent misses are coalesced: while one caller is fetching a query (or
+probing the version), every other caller asking for the same thing waits for
+that result instead of sending its own identical RPC.
+
+The legs themselves are not cached here but in the local trade store, which
+skips its fetch while the version is unchanged; the cache holds the small
+query results a page asks for directly (the cold-load headline metrics).
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+FRESHNESS_QUERY = """
+SELECT
+    max(block_timestamp) as max_block_timestamp,
+    count(*) as row_count
+FROM public.main_volume_table
+"""
+
+
+class SingleFlight:
+    """
+    Run at most one call per key at a time; concurrent callers for the same
+    key share the first caller's result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Return ``fn()``, or the result of the in-flight call for ``key``."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {"done": threading.Event()}
+        if not leader:
+            call["done"].wait()
+            if "error" in call:
+                raise call["error"]
+            return call["value"]
+        try:
+            call["value"] = fn()
+            return call["value"]
+        except BaseException as exc:
+            call["error"] = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["done"].set()
+
+
+def _size_of(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    return sys.getsizeof(value)
+
+
+class QueryCache:
+    """
+    TTL + data-version aware LRU cache.
+
+    Parameters:
+      - probe_interval: seconds between freshness probes.
+      - default_ttl: seconds an entry lives when no ttl is given to ``fetch``.
+      - max_bytes: upper bound on the summed size of cached values.
+    """
+
+    def __init__(self, probe_interval=30, default_ttl=300, max_bytes=256 * 1024 ** 2):
+        self.probe_interval = probe_interval
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._version = None
+        self._probed_at = None
+        self._flight = SingleFlight()
+
+    def version(self, execute):
+        """
+        Return the current data version, probing upstream at most once per
+        ``probe_interval``.
+
+        Parameters:
+          - execute: callable taking a SQL string and returning a DataFrame.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._probed_at is not None and now - self._probed_at < self.probe_interval:
+                return self._version
+        return self._flight.do(("version",), lambda: self._probe(execute))
+
+    def _probe(self, execute):
+        probe = execute(FRESHNESS_QUERY)
+        version = (
+            str(probe["max_block_timestamp"].iloc[0]),
+            int(probe["row_count"].iloc[0]),
+        )
+        with self._lock:
+            self._version = version
+            self._probed_at = time.monotonic()
+        return version
+
+    def _lookup(self, query):
+        entry = self._entries.get(query)
+        if entry is None:
+            return None
+        value, expires_at, version, _ = entry
+        if time.monotonic() < expires_at and version == self._version:
+            self._entries.move_to_end(query)
+            return entry
+        self._drop(query)
+        return None
+
+    def _store(self, query, value, version, ttl):
+        self._drop(query)
+        size = _size_of(value)
+        self._entries[query] = (value, time.monotonic() + ttl, version, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            self._drop(next(iter(self._entries)))
+
+    def fetch(self, query, execute, ttl=None):
+        """
+        Return the result of ``execute(query)``, served from cache when the
+        entry is younger than its TTL and was fetched at the current version.
+        """
+        ttl = self.default_ttl if ttl is None else ttl
+        with self._lock:
+            entry = self._lookup(query)
+            if entry is not None:
+                return entry[0]
+            version = self._version
+
+        def load():
+            value = execute(query)
+            with self._lock:
+                self._store(query, value, version, ttl)
+            return value
+
+        return self._flight.do(("query", query, version), load)
+
+    def _drop(self, query):
+        entry = self._entries.pop(query, None)
+        if entry is not None:
+            self._bytes -= entry[3]
+
+    def invalidate(self):
+        """Forget every entry and force the next ``version`` call to probe."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._probed_at = None
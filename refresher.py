@@ -0,0 +1,259 @@
+"""
+Background refresh of the dashboard data.
+
+One ``BackgroundRefresher`` per server process owns a worker thread that
+re-runs a refresh function every ``interval`` seconds and publishes the
+result as an immutable ``Snapshot``. Sessions only ever read the newest
+published snapshot (a single reference read), so their reruns never wait on
+Supabase; the only exceptions are the very first load of a fresh process and
+an explicit "Refresh now".
+"""
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+
+import pandas as pd
+
+from aggregations import compute_aggregates
+from instrumentation import recorder, span
+from pyramid import fetch_daily_totals
+from timeline import TradeTimeline
+from wallet_index import fetch_wallet_history
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """
+    One published state of the dashboard data. Treat every field as
+    read-only: the same objects are shared by all sessions.
+
+    Attributes:
+      - version: trade store generation the legs were read at.
+      - legs: trade-leg DataFrame, newest first.
+      - aggregates: DashboardAggregates computed from ``legs``.
+      - timeline: TradeTimeline of ``legs`` for the trades scatter.
+      - built_at: UTC time the snapshot was computed.
+      - pyramid: optional PyramidView (the aggregate pyramid's tiles at this
+                 refresh) for the longer chart ranges.
+      - wallet_index: optional WalletIndexView (the wallet index at this
+                      refresh) for the new vs returning users.
+    """
+
+    version: object
+    legs: pd.DataFrame
+    aggregates: object
+    timeline: TradeTimeline
+    built_at: pd.Timestamp
+    pyramid: object = None
+    wallet_index: object = None
+
+
+# Backfills aggregate the whole table, so they get longer than the client's
+# default per-query timeout
+PYRAMID_BACKFILL_TIMEOUT = 120
+WALLET_BACKFILL_TIMEOUT = 180
+
+
+def make_dashboard_refresh(client, query_cache, trade_store, sketches, metrics_engine,
+                           pyramid=None, wallet_index=None):
+    """
+    Build the refresh function for the dashboard: probe the data version,
+    pull new legs into the trade store, fold them into the wallet sketches,
+    the hourly metrics buckets and (when given) the aggregate pyramid and the
+    wallet index, and recompute the aggregates (always, since their windows
+    end at "now"). The trade timeline is only rebuilt when the store's
+    generation changes, i.e. after every fetch, forced or not.
+
+    The pyramid and the wallet index are updated concurrently, and their
+    backfill queries run on the client's pool, so a cold load waits for the
+    slowest backfill rather than for all of them in turn.
+    """
+    def backfill(since, until):
+        return fetch_daily_totals(
+            lambda queries, columns: client.execute_many(
+                queries, timeout=PYRAMID_BACKFILL_TIMEOUT, columns=columns,
+                label="pyramid_backfill",
+            ),
+            since, until,
+        )
+
+    def backfill_wallets(since, until):
+        return fetch_wallet_history(
+            lambda query, columns: client.execute_sql(
+                query, timeout=WALLET_BACKFILL_TIMEOUT, columns=columns,
+                label="wallet_index_backfill",
+            ),
+            since, until,
+        )
+
+    structures = []
+    if pyramid is not None:
+        structures.append(("pyramid.update", pyramid, backfill))
+    if wallet_index is not None:
+        structures.append(("wallet_index.update", wallet_index, backfill_wallets))
+    updates = ThreadPoolExecutor(
+        max_workers=max(len(structures), 1), thread_name_prefix="refresh"
+    )
+
+    def update_structure(name, structure, fill, legs):
+        with span("transform", name):
+            structure.update(
+                legs, since=trade_store.last_since, version=trade_store.generation,
+                backfill=fill,
+            )
+
+    timeline = None
+
+    def refresh(force=False, on_page=None):
+        nonlocal timeline
+        data_version = query_cache.version(
+            lambda query: client.execute_sql(query, label="freshness")
+        )
+        with span("transform", "trade_store.refresh"):
+            trade_store.refresh(
+                client.stream_many, version=data_version, force=force, on_page=on_page
+            )
+        legs = trade_store.load()
+        # The pyramid and wallet index (and their backfills) run alongside the
+        # rest; copied contexts keep their spans on the refresh's trace
+        futures = [
+            updates.submit(contextvars.copy_context().run, update_structure, *args, legs)
+            for args in structures
+        ]
+        try:
+            with span("transform", "wallet_sketches.update"):
+                sketches.update(
+                    legs, since=trade_store.last_since, version=trade_store.generation
+                )
+            with span("transform", "metrics_engine.update"):
+                metrics_engine.update(
+                    legs, since=trade_store.last_since, version=trade_store.generation
+                )
+            with span("transform", "compute_aggregates"):
+                aggregates = compute_aggregates(
+                    legs, sketches=sketches, metrics_engine=metrics_engine
+                )
+        finally:
+            wait(futures)
+        for future in futures:
+            future.result()
+        if timeline is None or timeline.version != trade_store.generation:
+            with span("transform", "trade_timeline"):
+                timeline = TradeTimeline(legs, version=trade_store.generation)
+        return Snapshot(
+            version=trade_store.generation,
+            legs=legs,
+            aggregates=aggregates,
+            timeline=timeline,
+            built_at=pd.Timestamp.now(tz="UTC"),
+            # Views, not the live structures the next refresh updates
+            pyramid=None if pyramid is None else pyramid.view(),
+            wallet_index=None if wallet_index is None else wallet_index.view(),
+        )
+
+    return refresh
+
+
+class BackgroundRefresher:
+    """
+    Periodically runs ``refresh`` on a daemon thread and publishes its result.
+
+    Parameters:
+      - refresh: callable taking ``force`` and ``on_page`` keywords and
+                 returning a Snapshot (see ``make_dashboard_refresh``).
+      - interval: seconds between the end of one refresh and the next.
+
+    A failed refresh keeps the previous snapshot and is reported through
+    ``last_error`` until the next successful one.
+    """
+
+    def __init__(self, refresh, interval=60):
+        self.refresh = refresh
+        self.interval = interval
+        self.snapshot = None
+        self.last_refresh_at = None
+        self.last_error = None
+        # Legs received so far by the refresh in progress
+        self.progress = 0
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._force = False
+        self._requested = 0
+        self._completed = 0
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="dashboard-refresher", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _on_page(self, received):
+        self.progress = received
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._cond:
+                force, self._force = self._force, False
+                target = self._requested
+            trace = recorder.start_trace("background_refresh")
+            try:
+                self.progress = 0
+                snapshot = self.refresh(force=force, on_page=self._on_page)
+                error = None
+            except Exception as exc:  # keep serving the previous snapshot
+                snapshot, error = None, exc
+            finally:
+                recorder.finish_trace(trace)
+            with self._cond:
+                if snapshot is not None:
+                    self.snapshot = snapshot
+                    self.last_refresh_at = time.time()
+                self.last_error = error
+                self._completed = max(self._completed, target)
+                self._cond.notify_all()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def request_refresh(self, force=False):
+        """
+        Wake the worker for an immediate refresh. Returns a ticket for
+        ``wait``; the refresh that satisfies it starts after this call.
+        """
+        with self._cond:
+            self._requested += 1
+            self._force = self._force or force
+            ticket = self._requested
+        self._wake.set()
+        return ticket
+
+    def wait(self, ticket=0, timeout=None):
+        """
+        Block until a snapshot exists and the refresh for ``ticket`` (if any)
+        has finished. Returns False on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self.snapshot is None or self._completed < ticket:
+                if self.snapshot is None and self.last_error is not None:
+                    raise self.last_error
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def age(self):
+        """Seconds since the last successful refresh (None before the first)."""
+        if self.last_refresh_at is None:
+            return None
+        return time.time() - self.last_refresh_at
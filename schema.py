@@ -0,0 +1,129 @@
+"""
+Typed in-memory layout of trade legs.
+
+Legs are converted once, when they enter the trade store:
+
+  - chain, asset and side are pandas categoricals;
+  - wallet and transaction_hash are dictionary encoded the same way (integer
+    codes plus a lookup table of the distinct strings);
+  - volume is float64, parsed from whatever numeric or decimal string the
+    wire format produced;
+  - block_timestamp is datetime64[ns, UTC].
+
+The columns every consumer would otherwise re-derive are added at the same
+time (``DERIVED_COLUMNS``): the UTC hour and day buckets, the trades
+scatter's marker size, the lowercased chain and the chain's color index.
+
+Everything downstream can then group, filter and count on the integer codes
+and precomputed keys instead of Python strings.
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pandas.api.types import union_categoricals
+
+# Column -> wire type, used when legs are fetched in a typed format (csv)
+LEG_SCHEMA = {
+    "chain": pa.string(),
+    "asset": pa.string(),
+    "volume": pa.float64(),
+    "block_timestamp": pa.timestamp("us", tz="UTC"),
+    "transaction_hash": pa.string(),
+    "wallet": pa.string(),
+    "side": pa.string(),
+}
+LEG_COLUMNS = list(LEG_SCHEMA)
+
+CATEGORICAL_COLUMNS = ["chain", "asset", "side", "wallet", "transaction_hash"]
+
+# Computed from the columns above by ``normalize_legs``; never stored
+DERIVED_COLUMNS = ["hour", "day", "marker_size", "color_idx"]
+
+# Chains the dashboard has a color for, in ``color_idx`` order (-1: any other)
+CHAIN_KEYS = (
+    "ethereum",
+    "polygon",
+    "arbitrum",
+    "optimism",
+    "base",
+    "avalanche",
+    "bsc",
+    "celo",
+    "solana",
+)
+
+
+def marker_sizes(volume):
+    """Log-scaled dot sizes for trade volumes, clipped to 4..50 px."""
+    # Simple log scaling for dot sizes, clipped to reasonable min/max sizes
+    return np.clip(2 ** np.log(volume / 50 + 1), 4, 50)
+
+
+def _add_derived_columns(df):
+    ts = df["block_timestamp"]
+    df["hour"] = ts.dt.floor("h")
+    df["day"] = ts.dt.floor("D")
+    df["marker_size"] = marker_sizes(df["volume"].to_numpy())
+    # Lowercase and look up each distinct chain once, then map the codes;
+    # the trailing -1 gives missing chains (code -1) no color
+    names = pd.Index(df["chain"].cat.categories.astype(str).str.lower())
+    colors = np.append(pd.Index(CHAIN_KEYS).get_indexer(names), -1)
+    df["color_idx"] = colors[category_codes(df["chain"])].astype(np.int8)
+    return df
+
+
+def normalize_legs(df):
+    """
+    Give a freshly fetched (or freshly read) frame the leg columns, their
+    in-memory types and the derived columns.
+    """
+    df = df.reindex(columns=LEG_COLUMNS)
+    for col in CATEGORICAL_COLUMNS:
+        if not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+    df["volume"] = pd.to_numeric(df["volume"]).astype("float64")
+    df["block_timestamp"] = pd.to_datetime(
+        df["block_timestamp"], utc=True, format="ISO8601"
+    ).astype("datetime64[ns, UTC]")
+    return _add_derived_columns(df)
+
+
+def concat_legs(frames):
+    """
+    Concatenate normalized leg frames, merging their category tables so the
+    result stays categorical (plain ``pd.concat`` falls back to strings when
+    the categories differ).
+    """
+    frames = [f for f in frames if len(f)]
+    if not frames:
+        return normalize_legs(pd.DataFrame(columns=LEG_COLUMNS))
+    if len(frames) == 1:
+        return frames[0].reset_index(drop=True)
+    columns = {}
+    for col in LEG_COLUMNS + DERIVED_COLUMNS:
+        if isinstance(frames[0][col].dtype, pd.CategoricalDtype):
+            columns[col] = union_categoricals([f[col] for f in frames])
+        else:
+            columns[col] = pd.concat([f[col] for f in frames], ignore_index=True)
+    return pd.DataFrame(columns)
+
+
+def compact_categories(df):
+    """Drop category entries no row uses (e.g. before writing a partition)."""
+    df = df.copy()
+    for col in CATEGORICAL_COLUMNS:
+        df[col] = df[col].cat.remove_unused_categories()
+    return df
+
+
+def category_codes(series):
+    """Integer codes of a categorical column; -1 marks a missing value."""
+    return series.cat.codes.to_numpy()
+
+
+def distinct_count(codes):
+    """COUNT(DISTINCT ...) over category codes; -1 (NULL) is not counted."""
+    codes = codes[codes >= 0]
+    if codes.size == 0:
+        return 0
+    return int(np.count_nonzero(np.bincount(codes)))
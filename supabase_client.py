@@ -0,0 +1,301 @@
+"""
+Supabase ``execute_sql`` RPC client.
+
+One ``requests.Session`` with a keep-alive connection pool is shared by every
+call, so repeated queries reuse the same TLS connection.
+
+Large results can be streamed with ``iter_pages`` / ``stream_many``, which
+page through the query with keyset pagination and hand back one bounded
+DataFrame per page instead of decoding the whole result at once.
+``stream_many`` pages through independent queries on a thread pool, so the
+download takes roughly as long as the slowest query; ``execute_many`` does
+the same for independent queries with small results, each with its own
+timeout. Pages bound the decode
+memory; the trade store still merges them all before the dashboard sees any
+of them, so a cold load only shows the number of legs received so far.
+
+Two wire formats are supported. ``json`` is the RPC's native one JSON object
+per row. ``csv`` wraps the query so the server returns the whole result as a
+single CSV text value, which pyarrow's multithreaded reader turns straight
+into typed columns; it needs the column names up front and falls back to
+``json`` when they are not given.
+"""
+import contextvars
+import io
+import json
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import pandas as pd
+import pyarrow as pa
+import requests
+from pyarrow import csv as pa_csv
+from requests.adapters import HTTPAdapter
+
+from instrumentation import span
+
+WIRE_FORMATS = ("json", "csv")
+# Seconds a streaming worker waits on a full page queue before checking
+# whether the consumer has gone away
+STOP_POLL_INTERVAL = 0.1
+
+
+def csv_query(query, columns, order_by=None):
+    """
+    Wrap ``query`` so it returns one row whose ``csv`` field holds every
+    result row as quoted CSV (no header), in ``columns`` order.
+    """
+    fields = " || ',' || ".join(
+        f"""coalesce('"' || replace({col}::text, '"', '""') || '"', '')"""
+        for col in columns
+    )
+    order = f" ORDER BY {', '.join(order_by)}" if order_by else ""
+    return (
+        f"SELECT string_agg({fields}, E'\\n'{order}) AS csv\n"
+        f"FROM (\n{query}\n) AS csv_source"
+    )
+
+
+def decode_json_rows(body):
+    """Decode a native ``execute_sql`` response body into a DataFrame."""
+    # Extract the 'result' from each item in the list
+    return pd.DataFrame([item['result'] for item in json.loads(body)])
+
+
+def decode_csv(body, columns):
+    """
+    Decode the response to a ``csv_query`` into a DataFrame.
+
+    ``columns`` is a list of names (all read as strings) or a dict mapping
+    each name to the pyarrow type it should be parsed as.
+    """
+    if not isinstance(columns, dict):
+        columns = {col: pa.string() for col in columns}
+    data = json.loads(body)
+    text = data[0]['result']['csv'] if data else None
+    if not text:
+        return pd.DataFrame(columns=list(columns))
+    table = pa_csv.read_csv(
+        io.BytesIO(text.encode("utf-8")),
+        read_options=pa_csv.ReadOptions(column_names=list(columns)),
+        # csv_query sends NULL as an empty unquoted field and an empty
+        # string as "", so only the unquoted form reads as NULL
+        convert_options=pa_csv.ConvertOptions(
+            column_types=columns,
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=False,
+        ),
+    )
+    return table.to_pandas()
+
+
+class SupabaseClient:
+    """
+    Pooled client for ``/rest/v1/rpc/execute_sql``.
+
+    Parameters:
+      - url: Supabase project URL (or a local stand-in server).
+      - key: API key, sent as both ``apikey`` and bearer token.
+      - pool_size: connections kept alive and worker threads for
+                   stream_many / execute_many.
+      - timeout: default per-query timeout in seconds.
+      - wire_format: 'json' or 'csv' (see module docstring).
+    """
+
+    def __init__(self, url, key, pool_size=8, timeout=60, wire_format="json"):
+        if wire_format not in WIRE_FORMATS:
+            raise ValueError(f"wire_format must be one of {WIRE_FORMATS}")
+        self.rpc_endpoint = f"{url}/rest/v1/rpc/execute_sql"
+        self.timeout = timeout
+        self.wire_format = wire_format
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "apikey": key,
+            "Authorization": f"Bearer {key}",
+            "Content-Type": "application/json",
+        })
+        self._executor = ThreadPoolExecutor(
+            max_workers=pool_size, thread_name_prefix="execute_sql"
+        )
+
+    def _post(self, query, timeout=None, label=None):
+        timeout = self.timeout if timeout is None else timeout
+        with span("query", "execute_sql", label=label) as attrs:
+            response = self.session.post(
+                self.rpc_endpoint, json={"query": query}, timeout=timeout
+            )
+            response.raise_for_status()
+            attrs["bytes"] = len(response.content)
+        return response.content
+
+    def execute_sql(self, query, timeout=None, columns=None, order_by=None,
+                    label=None):
+        """
+        Run one query and return its rows as a DataFrame.
+
+        Parameters:
+          - columns: result column names, or a dict of name -> pyarrow type;
+                     required for the csv wire format.
+          - order_by: optional columns the csv rows are ordered by.
+          - label: name the query's timing spans are tagged with.
+        """
+        if self.wire_format == "csv" and columns:
+            body = self._post(csv_query(query, columns, order_by), timeout, label)
+            with span("transform", "decode_csv", label=label) as attrs:
+                df = decode_csv(body, columns)
+                attrs["rows"] = len(df)
+            return df
+        body = self._post(query, timeout, label)
+        with span("transform", "decode_json", label=label) as attrs:
+            df = decode_json_rows(body)
+            attrs["rows"] = len(df)
+        return df
+
+    def iter_pages(self, query, keys=("block_timestamp", "transaction_hash"),
+                   page_size=50_000, timeout=None, columns=None, label=None):
+        """
+        Yield the rows of ``query`` as DataFrames of at most ``page_size`` rows.
+
+        Pages are fetched with keyset pagination on ``keys``, which must be
+        unique per row and be columns of the query. Rows come back in
+        ascending key order; each page is decoded before the next one is
+        requested, so peak memory is bounded by the page size.
+        """
+        order = ", ".join(keys)
+        after = None
+        while True:
+            where = ""
+            if after is not None:
+                where = "WHERE " + _keyset_predicate(keys, after)
+            page_query = (
+                f"SELECT * FROM (\n{query}\n) AS page_source\n"
+                f"{where}\nORDER BY {order}\nLIMIT {page_size}"
+            )
+            page = self.execute_sql(
+                page_query, timeout, columns=columns, order_by=keys, label=label
+            )
+            if page.empty:
+                return
+            after = [page[key].iloc[-1] for key in keys]
+            yield page
+            if len(page) < page_size:
+                return
+
+    def stream_many(self, queries, page_size=50_000, timeout=None, columns=None):
+        """
+        Page through independent queries concurrently.
+
+        Parameters:
+          - queries: dict mapping a label to a SQL string (see ``iter_pages``
+                     for the key requirements).
+
+        Yields (label, DataFrame) pairs as pages arrive, in arrival order.
+        If the caller stops iterating early (``close()`` or an exception in
+        its loop), the workers stop after the page they are fetching and
+        their pool threads are free again once the generator is closed.
+        """
+        pages = queue.Queue(maxsize=2 * len(queries) or 1)
+        done = object()
+        stop = threading.Event()
+
+        def put(item):
+            # Never block on a full queue nobody reads any more
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=STOP_POLL_INTERVAL)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def pump(label, query):
+            try:
+                pager = self.iter_pages(
+                    query, page_size=page_size, timeout=timeout, columns=columns,
+                    label=label,
+                )
+                for page in pager:
+                    if not put((label, page)):
+                        return
+            finally:
+                put((label, done))
+
+        # Copied contexts keep the workers' spans on the caller's trace
+        futures = [
+            self._executor.submit(contextvars.copy_context().run, pump, label, query)
+            for label, query in queries.items()
+        ]
+        try:
+            remaining = len(futures)
+            while remaining:
+                label, page = pages.get()
+                if page is done:
+                    remaining -= 1
+                    continue
+                yield label, page
+        finally:
+            stop.set()
+            for future in futures:
+                future.cancel()
+            wait(futures)
+        for future in futures:
+            future.result()
+
+    def execute_many(self, queries, timeout=None, columns=None, label=None):
+        """
+        Run independent queries concurrently on the client's pool.
+
+        Parameters:
+          - queries: dict mapping a key to a SQL string.
+          - timeout: per-query timeout in seconds, either one for every query
+                     or a dict mapping keys to their own (missing keys use the
+                     client's default).
+          - columns: optional dict mapping keys to result columns (see
+                     ``execute_sql``).
+          - label: prefix of the queries' span labels (``<label>_<key>``).
+
+        Returns a dict mapping each key to its DataFrame once every query is
+        done. The first failing query's exception is re-raised.
+        """
+        timeouts = timeout if isinstance(timeout, dict) else dict.fromkeys(queries, timeout)
+        columns = columns or {}
+        # Copied contexts keep the workers' spans on the caller's trace
+        futures = {
+            key: self._executor.submit(
+                contextvars.copy_context().run,
+                self.execute_sql, query, timeouts.get(key),
+                columns=columns.get(key),
+                label=key if label is None else f"{label}_{key}",
+            )
+            for key, query in queries.items()
+        }
+        wait(futures.values())
+        return {key: future.result() for key, future in futures.items()}
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+
+def _keyset_predicate(keys, values):
+    # (k1, k2) > (v1, v2) spelled out as k1 > v1 OR (k1 = v1 AND k2 > v2)
+    literals = [_sql_literal(v) for v in values]
+    terms = []
+    for i, key in enumerate(keys):
+        equal = [f"{keys[j]} = {literals[j]}" for j in range(i)]
+        terms.append("(" + " AND ".join(equal + [f"{key} > {literals[i]}"]) + ")")
+    return "(" + " OR ".join(terms) + ")"
+
+
+def _sql_literal(value):
+    if value is None:
+        return "NULL"
+    if isinstance(value, pd.Timestamp):
+        return f"'{value.isoformat()}'"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + str(value).replace("'", "''") + "'"
@@ -0,0 +1,84 @@
+"""
+Time buckets and time slices of the trade legs, in int64 nanoseconds.
+
+Shared by the structures that fold the trade store's legs in incrementally
+(wallet sketches, metrics engine, aggregate pyramid, wallet index): bucket
+widths and boundaries, the cutoff an update rebuilds from, and ``LegTimes``,
+which finds the legs at or after a time in the store's newest-first frame by
+binary search.
+"""
+import numpy as np
+import pandas as pd
+
+MINUTE_NS = 60 * 10 ** 9
+HOUR_NS = 60 * MINUTE_NS
+DAY_NS = 24 * HOUR_NS
+WEEK_NS = 7 * DAY_NS
+# Weeks start on Mondays; 1970-01-05 is the first Monday after the epoch
+WEEK_ORIGIN_NS = 4 * DAY_NS
+
+
+def floor_ns(ns, width_ns, origin_ns=0):
+    """
+    Start of the ``width_ns`` bucket holding ``ns`` (int or int64 array),
+    with bucket boundaries offset by ``origin_ns`` from the epoch.
+    """
+    return (ns - origin_ns) // width_ns * width_ns + origin_ns
+
+
+def week_floor(ns):
+    """Start of the Monday-based week holding ``ns``."""
+    return floor_ns(ns, WEEK_NS, WEEK_ORIGIN_NS)
+
+
+def refresh_cutoff(since, through, width_ns=1):
+    """
+    Start of the oldest bucket an incremental update has to rebuild.
+
+    ``since`` is the trade store's last re-fetch cutoff and ``through`` the
+    newest time (ns) the structure already folded in; the older of the two
+    wins in case the structure missed a refresh (e.g. the process stopped in
+    between). None when either is None: rebuild everything.
+    """
+    if since is None or through is None:
+        return None
+    return floor_ns(min(pd.Timestamp(since).value, int(through)), width_ns)
+
+
+class LegTimes:
+    """
+    Ascending timestamps of a newest-first leg frame (``TradeStore.load``).
+
+    Attributes:
+      - ns: int64 timestamps, oldest first; a reversed view of the frame's
+            column, not a copy. NaT (the smallest int64) sorts first.
+      - oldest, newest: first and last valid timestamp (None without any).
+    """
+
+    def __init__(self, legs):
+        self.legs = legs
+        self.ns = legs["block_timestamp"].array.asi8[::-1]
+        first_valid = np.searchsorted(self.ns, pd.NaT.value, side="right")
+        valid = first_valid < self.ns.size
+        self.oldest = int(self.ns[first_valid]) if valid else None
+        self.newest = int(self.ns[-1]) if valid else None
+
+    @property
+    def first_day(self):
+        """
+        Start of the oldest leg's day. The store keeps whole days, so its legs
+        are complete from here on.
+        """
+        return None if self.oldest is None else floor_ns(self.oldest, DAY_NS)
+
+    def count_since(self, ns):
+        """Number of legs at or after ``ns``."""
+        return self.ns.size - np.searchsorted(self.ns, ns, side="left")
+
+    def since(self, ns):
+        """The legs at or after ``ns`` (the leading rows, newest first)."""
+        return self.legs.iloc[:self.count_since(ns)]
+
+    def between(self, start_ns, end_ns):
+        """The legs in [start_ns, end_ns), newest first."""
+        return self.legs.iloc[self.count_since(end_ns):self.count_since(start_ns)]
@@ -0,0 +1,88 @@
+"""
+Chart-ready trade timeline for the Mach Trades scatter.
+
+Built once per trade store generation: the legs with a usable chain, oldest
+first, with the running volume total already computed (marker sizes come
+with the legs, see ``schema.normalize_legs``). A lookback is then two binary
+searches and a slice; the window's cumulative volume is the running total
+minus its value just before the window, so switching periods never filters,
+copies or sorts the whole table.
+"""
+import numpy as np
+import pandas as pd
+
+from schema import category_codes
+
+
+def _with_chain(ordered):
+    # Drop null (code -1) and empty-string chains using the category codes
+    chain_codes = category_codes(ordered['chain'])
+    empty_code = ordered['chain'].cat.categories.get_indexer([''])[0]
+    ordered = ordered[(chain_codes >= 0) & (chain_codes != empty_code)]
+    ordered = ordered.reset_index(drop=True)
+    ordered['chain'] = ordered['chain'].cat.remove_unused_categories()
+    return ordered
+
+
+def continuation(legs, cumulative_start):
+    """
+    Plot rows for legs that arrived after a window (oldest first), with the
+    running volume continuing from ``cumulative_start``.
+    """
+    ordered = _with_chain(legs)
+    volume = ordered['volume'].to_numpy()
+    cumulative = cumulative_start + np.nancumsum(volume)
+    cumulative[np.isnan(volume)] = np.nan
+    return ordered.assign(cumulative_volume=cumulative)
+
+
+class TradeTimeline:
+    """
+    Oldest-first trade legs with precomputed plot columns.
+
+    Parameters:
+      - legs: trade legs, newest first (``TradeStore.load``).
+      - version: trade store generation the legs belong to.
+    """
+
+    def __init__(self, legs, version=None):
+        self.version = version
+        # The store is newest first, so reversing gives time order for free
+        ordered = _with_chain(legs.iloc[::-1])
+
+        volume = ordered['volume'].to_numpy()
+        self._running = np.nancumsum(volume)
+        self.trades = ordered
+        self._ts = ordered['block_timestamp'].array.asi8
+        self._missing = np.isnan(volume)
+
+    def __len__(self):
+        return len(self.trades)
+
+    @property
+    def newest(self):
+        """Timestamp of the newest trade (None when there are none)."""
+        return pd.Timestamp(self._ts[-1], tz="UTC") if len(self._ts) else None
+
+    def window(self, start, end=None):
+        """
+        Trades with ``start <= block_timestamp`` (and ``<= end`` when given),
+        oldest first, with a ``cumulative_volume`` column starting at the
+        window's first trade.
+        """
+        lo = np.searchsorted(self._ts, pd.Timestamp(start).value, side="left")
+        hi = len(self._ts)
+        if end is not None:
+            hi = np.searchsorted(self._ts, pd.Timestamp(end).value, side="right")
+        hi = max(hi, lo)
+        offset = self._running[lo - 1] if lo > 0 else 0.0
+        cumulative = self._running[lo:hi] - offset
+        # Legs without a volume get no running total, like Series.cumsum
+        cumulative[self._missing[lo:hi]] = np.nan
+        return self.trades.iloc[lo:hi].assign(cumulative_volume=cumulative)
+
+    def lookback(self, hours, now=None):
+        """The last ``hours`` hours up to ``now`` (defaults to now)."""
+        if now is None:
+            now = pd.Timestamp.now(tz="UTC")
+        return self.window(now - pd.Timedelta(hours=hours))
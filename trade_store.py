@@ -0,0 +1,210 @@
+"""
+Local on-disk store of Mach trade legs.
+
+Trade legs (the source and dest side of every row in
+``public.main_volume_table``) are kept as one Parquet file per UTC day under
+``root``. A small JSON file remembers the newest ``block_timestamp`` /
+``transaction_hash`` seen, so a refresh only asks Supabase for rows newer
+than that watermark. Each refresh re-fetches a bounded window before the
+watermark and replaces whatever the store held for that window, which picks
+up late-arriving or corrected rows. With a ``history`` bound, nothing older
+than it is fetched and older day partitions are dropped as time passes.
+"""
+import json
+import os
+import threading
+from contextlib import closing
+from datetime import timedelta
+
+import pandas as pd
+
+from queries import SIDES, legs_query
+from schema import (
+    LEG_COLUMNS,
+    LEG_SCHEMA,
+    compact_categories,
+    concat_legs,
+    normalize_legs,
+)
+
+def _sort_legs(df):
+    # Same ordering the original full-table query used
+    return df.sort_values(
+        ["block_timestamp", "transaction_hash"], ascending=[False, True]
+    ).reset_index(drop=True)
+
+
+class TradeStore:
+    """
+    Persistent, incrementally refreshed copy of the trade legs.
+
+    The in-memory frame is kept alongside the Parquet files so that a refresh
+    with no new trades costs one small query and no disk reads.
+
+    Parameters:
+      - root: directory of the Parquet partitions.
+      - refetch_window: how far before the watermark each refresh re-fetches.
+      - history: optional callable returning the oldest tz-aware timestamp
+                 worth keeping (e.g. ``queries.history_start``); the whole
+                 table is kept when omitted.
+    """
+
+    def __init__(self, root, refetch_window=timedelta(hours=6), history=None):
+        self.root = root
+        self.refetch_window = refetch_window
+        self.history = history
+        self._lock = threading.Lock()
+        self._df = None
+        self.version = None
+        # Bumped by every refresh that actually fetched: structures built from
+        # the legs key on it, since a forced re-fetch of corrected rows can
+        # leave the upstream ``version`` unchanged
+        self.generation = 0
+        # Cutoff of the last re-fetch (None when it was a full load)
+        self.last_since = None
+        os.makedirs(root, exist_ok=True)
+
+    @property
+    def _meta_path(self):
+        return os.path.join(self.root, "meta.json")
+
+    def _day_path(self, day):
+        return os.path.join(self.root, f"day={day:%Y-%m-%d}.parquet")
+
+    def watermark(self):
+        """Return the stored watermark dict, or None for an empty store."""
+        if not os.path.exists(self._meta_path):
+            return None
+        with open(self._meta_path) as f:
+            return json.load(f)
+
+    def _write_meta(self, meta):
+        tmp = self._meta_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._meta_path)
+
+    def _write_day(self, day, day_df):
+        path = self._day_path(day)
+        if day_df.empty:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        tmp = path + ".tmp"
+        # Derived columns are recomputed on read, not stored
+        compact_categories(day_df[LEG_COLUMNS]).to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+
+    def _drop_days_before(self, oldest):
+        for name in os.listdir(self.root):
+            if name.startswith("day=") and name.endswith(".parquet"):
+                if pd.Timestamp(name[4:14], tz="UTC") < oldest:
+                    os.remove(os.path.join(self.root, name))
+
+    def _read_all(self):
+        files = sorted(
+            os.path.join(self.root, name)
+            for name in os.listdir(self.root)
+            if name.startswith("day=") and name.endswith(".parquet")
+        )
+        if not files:
+            return normalize_legs(pd.DataFrame(columns=LEG_COLUMNS))
+        return _sort_legs(concat_legs([normalize_legs(pd.read_parquet(f)) for f in files]))
+
+    def load(self):
+        """Return every stored trade leg, newest first."""
+        with self._lock:
+            if self._df is None:
+                self._df = self._read_all()
+            return self._df
+
+    def refresh(self, stream, version=None, force=False, on_page=None):
+        """
+        Pull new trade legs and merge them into the store.
+
+        Parameters:
+          - stream: callable taking a dict of label -> SQL string and a
+                    ``columns`` keyword, yielding (label, DataFrame) pages as
+                    they arrive (e.g. ``SupabaseClient.stream_many``). The
+                    source and dest legs are requested as two independent
+                    queries.
+          - version: optional upstream data version; when it matches the
+                     version of the last refresh nothing is fetched.
+          - force: fetch even if ``version`` is unchanged.
+          - on_page: optional callback called with the number of legs
+                     received so far after each page is decoded. It only
+                     reports progress: the pages are merged into the store
+                     once the last one is in, since every merge rewrites the
+                     store's newest-first frame.
+
+        Returns the re-fetched rows (everything at or after the refresh cutoff).
+        """
+        with self._lock:
+            if self._df is None:
+                self._df = self._read_all()
+            if not force and version is not None and version == self.version:
+                return self._df.iloc[0:0]
+            meta = self.watermark()
+            since = None
+            if meta is not None:
+                since = pd.Timestamp(meta["block_timestamp"]) - self.refetch_window
+            # Full loads and long-stale stores only fetch the kept history
+            oldest = None if self.history is None else self.history().floor("D")
+            fetch_since = since
+            if oldest is not None and (since is None or since < oldest):
+                fetch_since = oldest
+
+            # Each page is converted to typed columns as soon as it lands, so
+            # only one page of raw JSON rows is alive at a time
+            queries = {
+                side: legs_query(fetch_since, side=side, ordered=False)
+                for side in SIDES
+            }
+            pages = []
+            received = 0
+            # Closed on the way out, so a page that fails to convert stops
+            # the stream instead of leaving its workers blocked
+            with closing(stream(queries, columns=LEG_SCHEMA)) as pager:
+                for _, page in pager:
+                    pages.append(normalize_legs(page))
+                    received += len(page)
+                    if on_page is not None:
+                        on_page(received)
+            delta = concat_legs(pages)
+            # The typed pages are copied into delta; drop them before the merge
+            # below makes its own copy of the store
+            del pages
+
+            if since is None:
+                stale = self._df["block_timestamp"].notna()
+            else:
+                stale = self._df["block_timestamp"] >= since
+            # Every re-fetched leg is at or after the cutoff and every kept one
+            # before it (or NaT, which sorts last), so only the delta needs
+            # sorting to keep the store newest first
+            merged = concat_legs([_sort_legs(delta), self._df[~stale]])
+            if oldest is not None:
+                merged = merged[merged["block_timestamp"] >= oldest].reset_index(drop=True)
+
+            # Rewrite only the day partitions the re-fetch window touched
+            days = merged["day"]
+            touched = set(self._df.loc[stale, "day"])
+            touched.update(delta["day"])
+            for day in touched:
+                self._write_day(day, merged[days == day])
+            if oldest is not None:
+                self._drop_days_before(oldest)
+
+            if not delta.empty:
+                newest = delta.loc[delta["block_timestamp"].idxmax()]
+                meta = {
+                    "block_timestamp": newest["block_timestamp"].isoformat(),
+                    "transaction_hash": str(newest["transaction_hash"]),
+                }
+                self._write_meta(meta)
+
+            self._df = merged
+            self.version = version
+            self.generation += 1
+            self.last_since = since
+            return delta
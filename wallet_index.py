@@ -0,0 +1,376 @@
+"""
+Lifetime history of every wallet, for new vs returning user analytics.
+
+``WalletIndex`` maps each wallet (``sender_address``) to the timestamp and
+chain of its first leg, its lifetime trade count (one per source leg) and
+its summed leg volume. Legs before the trade store's re-fetch cutoff can no
+longer change, so they are folded into a persisted "settled" table exactly
+once; each refresh only re-summarizes the legs after that cutoff. Wallets
+seen before the store's history bound are filled in once, from a
+server-side GROUP BY over the older legs.
+
+Whether a wallet is new is then a lookup of its first-seen time rather than
+a replay of every earlier wallet, so new-user curves cover any range and
+returning-user share and cohort retention reduce to vectorized joins of the
+legs' wallet codes against the index.
+"""
+import json
+import os
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from queries import wallet_history_query
+from schema import category_codes
+from timebuckets import (
+    DAY_NS,
+    HOUR_NS,
+    WEEK_NS,
+    WEEK_ORIGIN_NS,
+    LegTimes,
+    floor_ns,
+    week_floor,
+)
+
+# Bucket width and origin per ``freq``; weeks start on Mondays
+FREQS = {"h": (HOUR_NS, 0), "D": (DAY_NS, 0), "W": (WEEK_NS, WEEK_ORIGIN_NS)}
+
+# Column -> wire type of ``wallet_history_query`` results
+WALLET_HISTORY_SCHEMA = {
+    "wallet": pa.string(),
+    "first_seen": pa.timestamp("us", tz="UTC"),
+    "first_chain": pa.string(),
+    "trades": pa.int64(),
+    "volume": pa.float64(),
+}
+
+
+def _empty_index():
+    return pd.DataFrame(
+        {
+            "first_seen": pd.Series([], dtype="datetime64[ns, UTC]"),
+            "first_chain": pd.Series([], dtype=object),
+            "trades": np.zeros(0, dtype=np.int64),
+            "volume": np.zeros(0),
+        },
+        index=pd.Index([], dtype=object, name="wallet"),
+    )
+
+
+def wallet_stats(legs):
+    """Index rows (first seen, first chain, trades, volume) of ``legs`` alone."""
+    codes = category_codes(legs["wallet"])
+    ns = legs["block_timestamp"].array.asi8
+    keep = (codes >= 0) & (ns != pd.NaT.value)
+    if not keep.any():
+        return _empty_index()
+    codes, ns = codes[keep], ns[keep]
+    is_source = (legs["side"].to_numpy() == "source")[keep]
+    chain = legs["chain"].to_numpy()[keep]
+    volume = np.nan_to_num(legs["volume"].to_numpy()[keep])
+    # Earliest leg per wallet; a trade's source leg before its dest leg
+    order = np.lexsort((~is_source, ns, codes))
+    wallets, first = np.unique(codes[order], return_index=True)
+    first = order[first]
+    n = len(legs["wallet"].cat.categories)
+    trades = np.bincount(codes, weights=is_source, minlength=n)[wallets]
+    volume = np.bincount(codes, weights=volume, minlength=n)[wallets]
+    return pd.DataFrame(
+        {
+            "first_seen": pd.to_datetime(ns[first], utc=True),
+            "first_chain": chain[first].astype(object),
+            "trades": trades.astype(np.int64),
+            "volume": volume,
+        },
+        index=pd.Index(legs["wallet"].cat.categories[wallets].astype(object), name="wallet"),
+    )
+
+
+def combine(older, newer):
+    """Index of the legs behind ``older`` and ``newer`` together."""
+    if older.empty:
+        return newer
+    if newer.empty:
+        return older
+    both = pd.concat([older, newer]).sort_values("first_seen", kind="stable")
+    grouped = both.groupby(level=0, sort=False)
+    out = pd.DataFrame({
+        "first_seen": grouped["first_seen"].first(),
+        "first_chain": grouped["first_chain"].first(),
+        "trades": grouped["trades"].sum(),
+        "volume": grouped["volume"].sum(),
+    })
+    out.index.name = "wallet"
+    return out
+
+
+def fetch_wallet_history(execute, since=None, until=None):
+    """
+    Index rows of the legs in [since, until) from ``wallet_history_query``.
+
+    Parameters:
+      - execute: callable taking a SQL string and a ``columns`` keyword and
+                 returning a DataFrame (e.g. ``SupabaseClient.execute_sql``).
+    """
+    rows = execute(wallet_history_query(since, until), columns=WALLET_HISTORY_SCHEMA)
+    if rows.empty:
+        return _empty_index()
+    return pd.DataFrame(
+        {
+            "first_seen": pd.to_datetime(
+                rows["first_seen"], utc=True, format="ISO8601"
+            ).astype("datetime64[ns, UTC]").to_numpy(),
+            "first_chain": rows["first_chain"].astype(object).to_numpy(),
+            "trades": pd.to_numeric(rows["trades"]).astype("int64").to_numpy(),
+            "volume": pd.to_numeric(rows["volume"]).astype("float64").to_numpy(),
+        },
+        index=pd.Index(rows["wallet"].astype(object), name="wallet"),
+    )
+
+
+@dataclass(frozen=True)
+class WalletIndexView:
+    """
+    Read-only state of a ``WalletIndex`` at one update. Updates replace the
+    index's table instead of modifying it, so a view keeps answering from
+    the state it was taken at.
+
+    Attributes:
+      - table: DataFrame indexed by wallet with first_seen, first_chain,
+               trades and volume.
+      - settled_until: time (ns) before which the legs are settled, None
+                       before the first update.
+    """
+
+    table: pd.DataFrame
+    settled_until: object
+
+    def first_seen(self, wallets):
+        """First-seen timestamps (ns, NaT for unknown wallets) of ``wallets``."""
+        table = self.table
+        return table["first_seen"].reindex(pd.Index(wallets, dtype=object)).array.asi8
+
+    def new_users(self, start=None, end=None, freq="D"):
+        """
+        Wallets first seen per ``freq`` bucket ('h', 'D' or 'W') in
+        [start, end]; a Series indexed by bucket start, oldest first.
+        """
+        ns = self.table["first_seen"].array.asi8
+        keep = np.ones(ns.size, dtype=bool)
+        if start is not None:
+            keep &= ns >= pd.Timestamp(start).value
+        if end is not None:
+            keep &= ns <= pd.Timestamp(end).value
+        buckets, counts = np.unique(floor_ns(ns[keep], *FREQS[freq]), return_counts=True)
+        return pd.Series(counts, index=pd.to_datetime(buckets, utc=True), name="new_users")
+
+    def _activity(self, legs, start, freq):
+        # Distinct (bucket, wallet code) pairs of the legs since start, with
+        # the bucket each wallet was first seen in
+        codes = category_codes(legs["wallet"])
+        ns = legs["block_timestamp"].array.asi8
+        keep = (codes >= 0) & (ns != pd.NaT.value)
+        if start is not None:
+            keep &= ns >= pd.Timestamp(start).value
+        pairs = pd.DataFrame({
+            "bucket": floor_ns(ns[keep], *FREQS[freq]),
+            "wallet": codes[keep],
+        }).drop_duplicates()
+        # One lookup per distinct wallet, not per leg
+        first = self.first_seen(legs["wallet"].cat.categories.astype(object))
+        first_bucket = floor_ns(first, *FREQS[freq])
+        first_bucket[first == pd.NaT.value] = pd.NaT.value
+        pairs["first_bucket"] = first_bucket[pairs["wallet"].to_numpy()]
+        return pairs
+
+    def activity_mix(self, legs, start=None, freq="D"):
+        """
+        Active wallets per ``freq`` bucket of ``legs`` since ``start``, split
+        into new (first seen in that bucket) and returning.
+
+        Returns a DataFrame indexed by bucket start with active, new,
+        returning and returning_share.
+        """
+        pairs = self._activity(legs, start, freq)
+        pairs["new"] = pairs["first_bucket"] >= pairs["bucket"]
+        mix = pairs.groupby("bucket").agg(active=("wallet", "size"), new=("new", "sum"))
+        mix["returning"] = mix["active"] - mix["new"]
+        mix["returning_share"] = mix["returning"] / mix["active"]
+        mix.index = pd.to_datetime(mix.index, utc=True)
+        return mix
+
+    def cohort_retention(self, legs, start=None):
+        """
+        Share of each weekly cohort (wallets first seen that week) active in
+        each later week of ``legs`` since ``start`` (defaults to the oldest
+        leg).
+
+        Returns a DataFrame indexed by cohort week start, with one column per
+        week since the cohort's first (0 is the first week, always 1.0).
+        Only the cohorts of whole weeks from ``start`` on are included, since
+        earlier cohorts' activity before the legs is unknown; weeks after the
+        newest leg's week have not happened yet and are NaN.
+        """
+        times = LegTimes(legs)
+        if times.newest is None:
+            return pd.DataFrame(index=pd.DatetimeIndex([], tz="UTC"), columns=pd.Index([], name="week"))
+        start_ns = times.oldest if start is None else pd.Timestamp(start).value
+        # The first whole week from start
+        first_cohort = week_floor(start_ns)
+        if first_cohort < start_ns:
+            first_cohort += WEEK_NS
+        newest_week = week_floor(times.newest)
+
+        pairs = self._activity(legs, pd.Timestamp(first_cohort, tz="UTC"), "W")
+        pairs = pairs[pairs["first_bucket"] >= first_cohort]
+        pairs = pairs.assign(age=(pairs["bucket"] - pairs["first_bucket"]) // WEEK_NS)
+        active = pairs.groupby(["first_bucket", "age"]).size().unstack("age", fill_value=0)
+        # Every week that can be observed, active or not
+        ages = np.arange(max((newest_week - first_cohort) // WEEK_NS + 1, 0))
+        active = active.reindex(columns=ages, fill_value=0).astype("float64")
+        cohort_ns = active.index.to_numpy(dtype=np.int64)
+        future = cohort_ns[:, None] + ages[None, :] * WEEK_NS > newest_week
+        active = active.mask(future)
+
+        sizes = self.new_users(pd.Timestamp(first_cohort, tz="UTC"), freq="W")
+        sizes.index = sizes.index.asi8
+        retention = active.div(sizes.reindex(active.index), axis=0)
+        retention.index = pd.to_datetime(retention.index, utc=True)
+        retention.columns.name = "week"
+        return retention
+
+
+class WalletIndex:
+    """
+    Persistent first-seen / lifetime totals per wallet.
+
+    Parameters:
+      - root: directory the settled index is saved to (settled.parquet plus
+              meta.json).
+
+    ``table`` is the index over every leg folded in so far: a DataFrame
+    indexed by wallet with first_seen, first_chain, trades and volume.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        self.version = None
+        # Index of every leg before settled_until (ns); those legs are final
+        self.settled = _empty_index()
+        self.settled_until = None
+        self.backfilled = False
+        self.table = _empty_index()
+        os.makedirs(root, exist_ok=True)
+        self._read()
+
+    @property
+    def _meta_path(self):
+        return os.path.join(self.root, "meta.json")
+
+    @property
+    def _settled_path(self):
+        return os.path.join(self.root, "settled.parquet")
+
+    def _read(self):
+        if not (os.path.exists(self._meta_path) and os.path.exists(self._settled_path)):
+            return
+        with open(self._meta_path) as f:
+            meta = json.load(f)
+        settled = pd.read_parquet(self._settled_path)
+        settled["first_chain"] = settled["first_chain"].astype(object)
+        settled.index = settled.index.astype(object)
+        self.settled = settled
+        self.table = settled
+        self.settled_until = meta["settled_until"]
+        self.backfilled = meta["backfilled"]
+
+    def _write(self):
+        tmp = self._settled_path + ".tmp"
+        self.settled.to_parquet(tmp)
+        os.replace(tmp, self._settled_path)
+        tmp = self._meta_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({
+                "settled_until": self.settled_until,
+                "backfilled": self.backfilled,
+            }, f)
+        os.replace(tmp, self._meta_path)
+
+    def update(self, legs, since=None, version=None, backfill=None):
+        """
+        Fold the trade store's legs into the index.
+
+        Parameters:
+          - legs: every stored leg, newest first (``TradeStore.load``).
+          - since: re-fetch cutoff of the last store refresh; the legs before
+                   it are settled. None settles nothing new.
+          - version: store generation (``TradeStore.generation``); nothing is
+                     done if it matches the last one.
+          - backfill: optional callable taking (since, until) tz-aware
+                      timestamps (since may be None) and returning index rows
+                      (see ``fetch_wallet_history``); called for the time
+                      before the legs the index has never seen.
+        """
+        with self._lock:
+            if version is not None and version == self.version:
+                return
+            times = LegTimes(legs)
+            if times.newest is None:
+                self.version = version
+                return
+            legs_start = times.first_day
+
+            settled, settled_until = self.settled, self.settled_until
+            changed = False
+            if backfill is not None and (
+                not self.backfilled or (settled_until is not None and settled_until < legs_start)
+            ):
+                # Before the legs: everything on a first load, otherwise the
+                # gap left by e.g. a process down for longer than the history
+                start = settled_until if self.backfilled else None
+                settled = combine(settled, backfill(
+                    None if start is None else pd.Timestamp(start, tz="UTC"),
+                    pd.Timestamp(legs_start, tz="UTC"),
+                ))
+                settled_until = legs_start
+                changed = True
+            if settled_until is None or settled_until < legs_start:
+                settled_until = legs_start
+
+            if since is not None and pd.Timestamp(since).value > settled_until:
+                cutoff = pd.Timestamp(since).value
+                settled = combine(settled, wallet_stats(times.between(settled_until, cutoff)))
+                settled_until = cutoff
+                changed = True
+
+            self.table = combine(settled, wallet_stats(times.since(settled_until)))
+            self.settled, self.settled_until = settled, settled_until
+            self.backfilled = self.backfilled or backfill is not None
+            self.version = version
+            if changed:
+                self._write()
+
+    def view(self):
+        """The index as of the last update, unaffected by later updates."""
+        with self._lock:
+            return WalletIndexView(self.table, self.settled_until)
+
+    def first_seen(self, wallets):
+        """See ``WalletIndexView.first_seen``."""
+        return self.view().first_seen(wallets)
+
+    def new_users(self, start=None, end=None, freq="D"):
+        """See ``WalletIndexView.new_users``."""
+        return self.view().new_users(start, end, freq)
+
+    def activity_mix(self, legs, start=None, freq="D"):
+        """See ``WalletIndexView.activity_mix``."""
+        return self.view().activity_mix(legs, start, freq)
+
+    def cohort_retention(self, legs, start=None):
+        """See ``WalletIndexView.cohort_retention``."""
+        return self.view().cohort_retention(legs, start)